@@ -0,0 +1,151 @@
+'''
+article_store
+=============
+
+Columnar storage of NewsAPI articles in the Arrow IPC file format. Stores are
+memory-mapped when opened, so that individual columns (e.g. only the title and
+content, for filtering) and individual articles can be read without loading
+the whole corpus into memory. Article ids are the row numbers in the store,
+i.e. the list index of the article in the equivalent raw JSON.
+
+Articles can also be streamed to and from JSON-lines files.
+'''
+
+from utils.datapath import datapath
+import pyarrow as pa
+import json
+
+COLUMNS = ['source_id', 'source_name', 'author', 'title', 'description',
+           'url', 'urlToImage', 'publishedAt', 'content']
+SCHEMA = pa.schema([(column, pa.string()) for column in COLUMNS])
+
+
+def _flatten(article):
+    '''Flatten the nested source field of a NewsAPI article'''
+    source = article.get('source') or {}
+    row = dict(source_id=source.get('id'), source_name=source.get('name'))
+    for column in COLUMNS[2:]:
+        row[column] = article.get(column)
+    return row
+
+
+def _unflatten(row):
+    '''Inverse of :obj:`_flatten`, for the columns which are available'''
+    article = {k: v for k, v in row.items() if not k.startswith('source_')}
+    if 'source_id' in row or 'source_name' in row:
+        article['source'] = dict(id=row.get('source_id'), name=row.get('source_name'))
+    return article
+
+
+def write_store(articles, filename, batch_size=10000):
+    '''Write articles to an article store, in batches so that the articles
+    can be streamed from any iterable.
+
+    Args:
+        articles (iterable): Articles (dict) in the NewsAPI format.
+        filename (str): Path to the store.
+        batch_size (int): Number of articles to hold in memory at once.
+    '''
+    with pa.OSFile(filename, 'wb') as sink:
+        with pa.ipc.new_file(sink, SCHEMA) as writer:
+            batch = []
+            for article in articles:
+                batch.append(_flatten(article))
+                if len(batch) == batch_size:
+                    writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=SCHEMA))
+                    batch = []
+            if batch:
+                writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=SCHEMA))
+
+
+class ArticleStore:
+    '''Read-only, memory-mapped access to an article store.
+
+    Args:
+        filename (str): Path to the store.
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        self._source = pa.memory_map(filename, 'r')
+        self.table = pa.ipc.open_file(self._source).read_all()  # Zero-copy
+        self._indexes = {}
+
+    def __len__(self):
+        return self.table.num_rows
+
+    def __getitem__(self, idx):
+        '''Get a single article by id'''
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(f'Article id {idx} out of range')
+        return _unflatten(self.table.slice(idx, 1).to_pylist()[0])
+
+    def column(self, name):
+        '''Get a single column as a list'''
+        return self.table.column(name).to_pylist()
+
+    def articles(self, columns=None):
+        '''Iterate over articles, reading only the requested columns.
+
+        Args:
+            columns (list): Columns to read (see :obj:`COLUMNS`). Default=all.
+        Yields:
+            article (dict): Articles, with only the requested fields.
+        '''
+        table = self.table if columns is None else self.table.select(columns)
+        for batch in table.to_batches():
+            for row in batch.to_pylist():
+                yield _unflatten(row)
+
+    def index(self, column):
+        '''Lookup of the first article id for each value of a column,
+        built on first use. Useful for titles and urls.'''
+        if column not in self._indexes:
+            lookup = {}
+            for idx, value in enumerate(self.column(column)):
+                lookup.setdefault(value, idx)
+            self._indexes[column] = lookup
+        return self._indexes[column]
+
+    def find(self, title=None, url=None):
+        '''Get the id of the first article with the given title or url,
+        or :obj:`None` if there is no such article.'''
+        if title is not None:
+            return self.index('title').get(title)
+        return self.index('url').get(url)
+
+
+def write_jsonl(articles, filename):
+    '''Write articles from any iterable to a JSON-lines file, one at a time.'''
+    with open(filename, 'w') as f:
+        for article in articles:
+            f.write(json.dumps(article))
+            f.write('\n')
+
+
+def iter_jsonl(filename):
+    '''Read articles from a JSON-lines file, one at a time.'''
+    with open(filename) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def save_store(articles, label):
+    '''Save articles to the article store data/raw/{label}.arrow'''
+    filename = datapath('raw', f'{label}.arrow')
+    write_store(articles, filename)
+    return filename
+
+
+def load_store(label):
+    '''Open the article store data/raw/{label}.arrow, converting it from
+    data/raw/{label}.json the first time.'''
+    filename = datapath('raw', f'{label}.arrow')
+    try:
+        return ArticleStore(filename)
+    except FileNotFoundError:
+        with open(datapath('raw', f'{label}.json')) as f:
+            write_store(json.load(f), filename)
+        return ArticleStore(filename)
@@ -0,0 +1,123 @@
+"""
+batch_filter
+============
+
+Score many keyword filter configurations against the same corpus, by
+scanning the articles once into a sparse article x term count matrix.
+"""
+
+from utils.keyword_filter import _article_text, _core_terms, _seed_terms
+from utils.term_matcher import TermMatcher
+from scipy.sparse import csr_matrix
+import numpy as np
+
+
+class ArticleTermMatrix:
+    '''Sparse count matrix of terms in articles, with rows only for
+    the articles which would be considered by
+    :obj:`keyword_filter.filter_articles` (i.e. the first article for each title,
+    and only if it has some text).
+
+    Args:
+        articles (list): list of dict (each article is the rawish
+                         response from NewsAPI)
+        terms (list): All terms (core and expanded seed terms) to be counted.
+    '''
+    def __init__(self, articles, terms):
+        self.terms = sorted(set(terms))
+        self.vocab = {term: col for col, term in enumerate(self.terms)}
+        matcher = TermMatcher(self.terms)
+        ids, lengths = [], []
+        indptr, indices, data = [0], [], []
+        titles = set()
+        for i, article in enumerate(articles):
+            if article['title'] in titles:
+                continue
+            titles.add(article['title'])
+            _content = _article_text(article)
+            if _content is None:
+                continue
+            for col, count in enumerate(matcher.count(_content)):
+                if count > 0:
+                    indices.append(col)
+                    data.append(count)
+            indptr.append(len(indices))
+            ids.append(i)
+            lengths.append(len(_content))
+        self.ids = np.array(ids, dtype=int)
+        self.lengths = np.array(lengths, dtype=float)
+        self.counts = csr_matrix((data, indices, indptr), dtype=np.int64,
+                                 shape=(len(ids), len(self.terms)))
+
+    def _weights(self, terms):
+        '''Vector of the number of times each vocab term appears in :obj:`terms`,
+        so that repeated terms are counted repeatedly, as in :obj:`filter_articles`'''
+        weights = np.zeros(len(self.terms), dtype=np.int64)
+        for term in terms:
+            try:
+                weights[self.vocab[term]] += 1
+            except KeyError:
+                raise KeyError(f'Term "{term}" was not counted when '
+                               'building the ArticleTermMatrix') from None
+        return weights
+
+    def score(self, core_terms, seed_terms, min_core_df=5, min_seed_df=None):
+        '''Score a single configuration, with arguments and return value
+        exactly as per :obj:`keyword_filter.filter_articles`.'''
+        return self.score_many([dict(core_terms=core_terms, seed_terms=seed_terms,
+                                     min_core_df=min_core_df,
+                                     min_seed_df=min_seed_df)])[0]
+
+    def score_many(self, configs):
+        '''Score many filter configurations in one sparse matrix product.
+
+        Args:
+            configs (list): List of dict, each containing the keyword arguments
+                            of :obj:`keyword_filter.filter_articles` (except
+                            :obj:`articles`).
+        Returns:
+            ranked_articles (list): One dict of ranked articles per configuration,
+                                    as returned by :obj:`filter_articles`.
+        '''
+        if not configs:
+            return []
+        # Two columns per configuration: core and seed term weights
+        weights = []
+        for config in configs:
+            weights.append(self._weights(_core_terms(config['core_terms'])))
+            weights.append(self._weights(_seed_terms(config['seed_terms'])))
+        totals = self.counts @ np.column_stack(weights)
+        ranked = []
+        for iconfig, config in enumerate(configs):
+            min_core_df = config.get('min_core_df', 5)
+            min_seed_df = config.get('min_seed_df')
+            if min_seed_df is None:
+                min_seed_df = min_core_df
+            n_core = totals[:, 2*iconfig]
+            n_seed = totals[:, 2*iconfig + 1]
+            mask = (n_core >= min_core_df) & (n_seed >= min_seed_df)
+            scores = n_seed[mask]*n_core[mask]/self.lengths[mask]
+            ranked.append(dict(zip(self.ids[mask].tolist(), scores.tolist())))
+        return ranked
+
+
+def sweep(articles, configs):
+    '''Score many filter configurations against the same articles, scanning
+    the text of each article only once.
+
+    Args:
+        articles (list): list of dict (each article is the rawish
+                         response from NewsAPI)
+        configs (list): List of dict, each containing the keyword arguments
+                        of :obj:`keyword_filter.filter_articles` (except
+                        :obj:`articles`).
+    Returns:
+        ranked_articles (list): One dict of ranked articles per configuration,
+                                as returned by :obj:`filter_articles`.
+    '''
+    terms = set()
+    for config in configs:
+        terms.update(_core_terms(config['core_terms']))
+        terms.update(_seed_terms(config['seed_terms']))
+    matrix = ArticleTermMatrix(articles, terms)
+    return matrix.score_many(configs)
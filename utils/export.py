@@ -0,0 +1,115 @@
+'''
+export
+======
+
+Export ranked articles to xlsx, CSV or Parquet. Rows are streamed in batches,
+so that large outputs are written in bounded memory, and the articles passed
+in are never modified.
+'''
+
+from utils.news_api import NEWSAPI_DATEFORMAT, NEWSAPI_TIMEFORMAT
+from utils import metrics
+from collections import Counter
+import pyarrow.parquet as pq
+import pyarrow as pa
+import pandas as pd
+import xlsxwriter
+import csv
+
+COLUMNS = ['publishedAt', 'score', 'source', 'title',
+           'author', 'description', 'content', 'url']
+DATE_FORMAT = '%d/%m/%Y'
+
+
+def ranked_rows(ranked_articles, articles, near_duplicates=None):
+    '''Rows of the export, from the highest to lowest ranked article,
+    skipping repeated titles. Dates are not yet formatted (see :obj:`batches`).
+
+    Args:
+        ranked_articles (dict): Ranked articles, as returned by
+                                :obj:`keyword_filter.filter_articles`.
+        articles (list): Articles (or an :obj:`ArticleStore`) indexed by
+                         :obj:`ranked_articles`.
+        near_duplicates (NearDuplicateIndex): If a (new) index is provided,
+                                              then near-duplicates of higher ranked
+                                              articles are also left out.
+    Yields:
+        row (dict): Values for each of :obj:`COLUMNS`.
+    '''
+    titles = set()
+    for idx, rank in Counter(ranked_articles).most_common():
+        art = articles[idx]
+        if art['title'] in titles:
+            continue
+        titles.add(art['title'])
+        if near_duplicates is not None and near_duplicates.is_duplicate(art):
+            continue
+        row = {column: art.get(column) for column in COLUMNS}
+        row.update(score=rank, source=art['source']['name'])
+        yield row
+
+
+def batches(rows, batch_size=10000):
+    '''Group rows into DataFrames, formatting the dates of each batch at once.'''
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield _format_batch(batch)
+            batch = []
+    if batch:
+        yield _format_batch(batch)
+
+
+def _format_batch(batch):
+    metrics.count('export.rows', len(batch))
+    df = pd.DataFrame(batch, columns=COLUMNS)
+    dates = pd.to_datetime(df['publishedAt'],
+                           format=NEWSAPI_DATEFORMAT+NEWSAPI_TIMEFORMAT)
+    df['publishedAt'] = dates.dt.strftime(DATE_FORMAT)
+    return df
+
+
+def _cell(value):
+    '''Convert missing values to empty cells'''
+    return None if pd.isnull(value) else value
+
+
+def write_xlsx(rows, filename, batch_size=10000):
+    '''Write rows to an xlsx file, in constant memory, with an index
+    column (as written by :obj:`pandas.DataFrame.to_excel`).'''
+    with metrics.timer('export', format='xlsx'):
+        workbook = xlsxwriter.Workbook(filename, {'constant_memory': True})
+        worksheet = workbook.add_worksheet()
+        bold = workbook.add_format({'bold': True})
+        worksheet.write_row(0, 1, COLUMNS, bold)
+        irow = 0
+        for df in batches(rows, batch_size):
+            for values in df.itertuples(index=False, name=None):
+                irow += 1
+                worksheet.write(irow, 0, irow - 1, bold)
+                for icol, value in enumerate(values, 1):
+                    value = _cell(value)
+                    if value is not None:
+                        worksheet.write(irow, icol, value)
+        workbook.close()
+
+
+def write_csv(rows, filename, batch_size=10000):
+    '''Write rows to a CSV file, one batch at a time'''
+    with metrics.timer('export', format='csv'), open(filename, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for df in batches(rows, batch_size):
+            writer.writerows([[_cell(value) for value in values]
+                              for values in df.itertuples(index=False, name=None)])
+
+
+def write_parquet(rows, filename, batch_size=10000):
+    '''Write rows to a Parquet file, one row group per batch'''
+    schema = pa.schema([(column, pa.float64() if column == 'score' else pa.string())
+                        for column in COLUMNS])
+    with metrics.timer('export', format='parquet'), pq.ParquetWriter(filename, schema) as writer:
+        for df in batches(rows, batch_size):
+            writer.write_table(pa.Table.from_pandas(df, schema=schema,
+                                                    preserve_index=False))
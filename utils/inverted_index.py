@@ -0,0 +1,132 @@
+'''
+inverted_index
+==============
+
+Positional inverted index of a corpus, for answering term and phrase
+count queries without rescanning the text of every document.
+
+Text is normalised with :obj:`tokens.split_tokens` (as in
+:obj:`tokenizer.tokenize`), so phrases are matched on whole words: unlike
+:obj:`str.count`, "nhs" does not match "nhsx".
+'''
+
+from utils.tokens import split_tokens
+from utils.keyword_filter import _article_text
+from collections import defaultdict
+import pickle
+
+
+class InvertedIndex:
+    '''Positional inverted index, which can be extended incrementally.
+
+    Attributes:
+        postings (dict): Mapping of term --> {doc_id: [positions]}
+        lengths (dict): Mapping of doc_id --> length of the document (number of
+                        characters for text, or number of tokens for token lists).
+    '''
+    def __init__(self):
+        self.postings = defaultdict(dict)
+        self.lengths = {}
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def add_tokens(self, doc_id, tokens, length=None):
+        '''Add a tokenized document to the index.
+
+        Args:
+            doc_id (int): Id of the document, which must be new to the index.
+            tokens (list): Tokens in the document.
+            length (int): Length of the document. Default=number of tokens.
+        '''
+        if doc_id in self.lengths:
+            raise ValueError(f'Document {doc_id} is already in the index')
+        self.lengths[doc_id] = len(tokens) if length is None else length
+        for position, token in enumerate(tokens):
+            self.postings[token].setdefault(doc_id, []).append(position)
+
+    def add_text(self, doc_id, text):
+        '''Add a document of raw text to the index.'''
+        self.add_tokens(doc_id, split_tokens(text), length=len(text))
+
+    def add_articles(self, articles, start=0):
+        '''Add NewsAPI articles to the index, with the same text as is used by
+        :obj:`keyword_filter.filter_articles`. Articles are given ids according to
+        their position, offset by :obj:`start` (e.g. for adding a new week of
+        articles to the end of an existing corpus).'''
+        for doc_id, article in enumerate(articles, start):
+            text = _article_text(article)
+            if text is not None:
+                self.add_text(doc_id, text)
+
+    @classmethod
+    def from_articles(cls, articles):
+        index = cls()
+        index.add_articles(articles)
+        return index
+
+    @classmethod
+    def from_docs(cls, docs):
+        '''Index tokenized documents (e.g. the output of :obj:`tokenizer.tokenize`)'''
+        index = cls()
+        for doc_id, tokens in enumerate(docs):
+            index.add_tokens(doc_id, tokens)
+        return index
+
+    def phrase_counts(self, phrase):
+        '''Count the (non-overlapping) occurrences of a term or phrase
+        in each document.
+
+        Args:
+            phrase (str): Term or phrase (which will be normalised like the text).
+        Returns:
+            counts (dict): Mapping of doc_id --> count, for documents containing the phrase.
+        '''
+        tokens = split_tokens(phrase)
+        if not tokens or any(token not in self.postings for token in tokens):
+            return {}
+        postings = [self.postings[token] for token in tokens]
+        if len(tokens) == 1:
+            return {doc_id: len(positions) for doc_id, positions in postings[0].items()}
+        doc_ids = set.intersection(*(set(p) for p in sorted(postings, key=len)))
+        counts = {}
+        for doc_id in doc_ids:
+            following = [set(p[doc_id]) for p in postings[1:]]
+            count, last_end = 0, 0
+            for start in postings[0][doc_id]:
+                if start >= last_end and all(start + offset in positions
+                                             for offset, positions in enumerate(following, 1)):
+                    count += 1
+                    last_end = start + len(tokens)
+            if count > 0:
+                counts[doc_id] = count
+        return counts
+
+    def counts(self, phrases):
+        '''Sum of :obj:`phrase_counts` over a list of phrases (repeats are counted
+        repeatedly), for each document containing any of the phrases.'''
+        totals = defaultdict(int)
+        for phrase in phrases:
+            for doc_id, count in self.phrase_counts(phrase).items():
+                totals[doc_id] += count
+        return dict(totals)
+
+    def docs_containing(self, terms):
+        '''Ids of documents containing every one of the terms (or phrases)'''
+        doc_ids = None
+        for term in terms:
+            _doc_ids = set(self.phrase_counts(term))
+            doc_ids = _doc_ids if doc_ids is None else doc_ids & _doc_ids
+        return set() if doc_ids is None else doc_ids
+
+    def save(self, filename):
+        with open(filename, 'wb') as f:
+            pickle.dump((dict(self.postings), self.lengths), f)
+
+    @classmethod
+    def load(cls, filename):
+        index = cls()
+        with open(filename, 'rb') as f:
+            postings, index.lengths = pickle.load(f)
+        index.postings.update(postings)
+        return index
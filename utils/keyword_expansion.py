@@ -6,8 +6,8 @@ Data-driven expansion of keywords [experimental]
 """
 
 from sklearn.feature_extraction.text import CountVectorizer
-from collections import Counter
 import numpy as np
+import pickle
 
 
 def matrix_fraction(X):
@@ -24,13 +24,83 @@ def matrix_fraction(X):
     return _sum/(_sum.sum())
 
 
+def column_fraction(X):
+    '''As :obj:`matrix_fraction`, but for dense or sparse matrices, and
+    always returning a flat array (of zeros if the matrix is empty).
+
+    Args:
+        X: A numpy-like or scipy.sparse matrix (m x n)
+    Returns:
+        Y: A numpy array (n).
+    '''
+    _sum = np.asarray(X.sum(axis=0), dtype=float).ravel()
+    total = _sum.sum()
+    return _sum/total if total > 0 else _sum
+
+
+def jlh_scores(foreground, background):
+    '''JLH score of each column, for dense or sparse matrices. Columns which
+    never appear in the background are given a score of zero.
+
+    Args:
+        foreground: A numpy-like or scipy.sparse matrix (m x n)
+        background: A numpy-like or scipy.sparse matrix (M x n)
+    Returns:
+        scores: A numpy array (n).
+    '''
+    a = column_fraction(foreground)
+    b = column_fraction(background)
+    ratio = np.divide(a, b, out=np.zeros_like(a), where=b > 0)
+    return ratio * (a - b)
+
+
 def jlh(foreground, background):
-    a = matrix_fraction(foreground)
-    b = matrix_fraction(background)
-    jlh_scores = np.asarray(a / b) * np.asarray(a - b)
-    if len(jlh_scores.shape) > 1:
-        jlh_scores = jlh_scores[0]
-    return list(jlh_scores)
+    return list(jlh_scores(foreground, background))
+
+
+def top_keywords(scores, search_idxs, threshold=0.3, n_unkeywords=10):
+    '''Select keywords and unkeywords from the JLH scores of every feature,
+    as described in :obj:`keyword_expansion`, in linear time.
+
+    Args:
+        scores (np.array): JLH score of each feature.
+        search_idxs (list): Feature indexes of the search terms.
+        threshold (float): As for :obj:`keyword_expansion`.
+        n_unkeywords (int): As for :obj:`keyword_expansion`.
+    Returns:
+        keyword_idxs (np.array): Feature indexes of the keywords, in order of feature.
+        unkeyword_idxs (np.array): Feature indexes of the unkeywords, least related first.
+    '''
+    significant_score = scores[search_idxs].max()*threshold
+    keyword_idxs = np.flatnonzero(scores > significant_score)
+    n_unkeywords = min(n_unkeywords, len(scores))
+    if n_unkeywords <= 0:
+        return keyword_idxs, np.array([], dtype=int)
+    # Partition around the n-th lowest score, breaking ties in order of feature
+    nth_score = scores[np.argpartition(scores, n_unkeywords - 1)[n_unkeywords - 1]]
+    lower = np.flatnonzero(scores < nth_score)
+    tied = np.flatnonzero(scores == nth_score)[:n_unkeywords - len(lower)]
+    unkeyword_idxs = np.concatenate([lower, tied])
+    unkeyword_idxs = unkeyword_idxs[np.argsort(scores[unkeyword_idxs], kind='stable')]
+    return keyword_idxs, unkeyword_idxs
+
+
+def _feature_names(vectorizer):
+    '''Feature names of a fitted vectorizer, for any version of scikit-learn'''
+    if hasattr(vectorizer, 'get_feature_names_out'):
+        return list(vectorizer.get_feature_names_out())
+    return vectorizer.get_feature_names()
+
+
+def _extract_keywords(features, vocabulary, scores, search_terms, threshold, n_unkeywords):
+    '''Select keywords and unkeywords from the JLH scores of every feature,
+    as described in :obj:`keyword_expansion`.'''
+    search_idxs = [vocabulary[term] for term in search_terms]
+    keyword_idxs, unkeyword_idxs = top_keywords(scores, search_idxs,
+                                                threshold, n_unkeywords)
+    keywords = {features[idx]: scores[idx] for idx in keyword_idxs}
+    unkeywords = {features[idx]: -scores[idx] for idx in unkeyword_idxs}
+    return keywords, unkeywords
 
 
 # Note: consider the following for cv_kwargs
@@ -38,7 +108,7 @@ def jlh(foreground, background):
 # max_features=500,
 # binary=False, stop_words='english'
 def keyword_expansion(docs, search_terms, threshold=0.3,
-                      n_unkeywords=10, **cv_kwargs):
+                      n_unkeywords=10, index=None, **cv_kwargs):
     """
     Generate an expanded set of keywords related to search terms in a corpus
     of documents, based on the JLH score.
@@ -50,6 +120,8 @@ def keyword_expansion(docs, search_terms, threshold=0.3,
                            equal to the threshold times the mininum JLH score of
                            the search terms.
         n_unkeywords (int): Number of terms least related to the search terms.
+        index (InvertedIndex): Index of :obj:`docs` (see :obj:`InvertedIndex.from_docs`)
+                               for finding the docs containing the search terms.
     Returns:
         keywords (list): List of keywords related to the search terms
         unkeywords (list): List of terms least related to the search terms.
@@ -57,8 +129,11 @@ def keyword_expansion(docs, search_terms, threshold=0.3,
 
     search_terms = search_terms.split()
     # Scan the documents for the search term, and prepare the docs for analysis
-    search_docs = [idx for idx, doc in enumerate(docs)
-                   if all(term in doc for term in search_terms)]
+    if index is None:
+        search_docs = [idx for idx, doc in enumerate(docs)
+                       if all(term in doc for term in search_terms)]
+    else:
+        search_docs = sorted(index.docs_containing(search_terms))
     docs = [' '.join(doc) for doc in docs]
     search_docs = [docs[idx] for idx in search_docs]
 
@@ -66,20 +141,65 @@ def keyword_expansion(docs, search_terms, threshold=0.3,
     vectorizer = CountVectorizer(**cv_kwargs)
     background = vectorizer.fit_transform(docs)
     foreground = vectorizer.transform(search_docs)
-    features = vectorizer.get_feature_names()
+    features = _feature_names(vectorizer)
 
     # Calculate significant related text scores
-    jlh_scores = jlh(foreground, background)
-
-    # Extract keywords
-    scores = {feat: score for feat, score in zip(features, jlh_scores)}
-    min_score = max(scores[term] for term in search_terms)
-    significant_score = min_score*threshold
-    keywords = {feat: score for feat, score in scores.items()
-                if score > significant_score}
-
-    # Extract unkeywords
-    unscores = {feat: -score for feat, score in scores.items()}
-    unkeywords = {feat: score for feat, score in
-                  Counter(unscores).most_common(n_unkeywords)}
-    return keywords, unkeywords
+    scores = jlh_scores(foreground, background)
+    return _extract_keywords(features, vectorizer.vocabulary_, scores,
+                             search_terms, threshold, n_unkeywords)
+
+
+def _identity(doc):
+    return doc
+
+
+class ExpansionEngine:
+    """
+    Reusable background for :obj:`keyword_expansion`, so that many sets of search
+    terms can be expanded against the same corpus. The background count matrix and
+    its column sums are calculated once, and the foreground documents for each query
+    are selected by a (sparse) index of which documents contain which tokens.
+
+    Args:
+        docs (list): List of tokenized documents (each doc is a list).
+        cv_kwargs: Keyword arguments for the CountVectorizer, as for :obj:`keyword_expansion`.
+    """
+    def __init__(self, docs, **cv_kwargs):
+        self.vectorizer = CountVectorizer(**cv_kwargs)
+        self.background = self.vectorizer.fit_transform([' '.join(doc) for doc in docs]).tocsr()
+        self.background_sums = np.asarray(self.background.sum(axis=0))  # 1 x n
+        self.features = _feature_names(self.vectorizer)
+        # Which docs contain which tokens, exactly as in the docs
+        presence = CountVectorizer(analyzer=_identity, binary=True)
+        self.presence = presence.fit_transform(docs).tocsc()
+        self.tokens = presence.vocabulary_
+
+    def search_docs(self, search_terms):
+        """Indexes of the documents containing all of the search terms (list)"""
+        if any(term not in self.tokens for term in search_terms):
+            return np.array([], dtype=int)
+        rows = None
+        for term in search_terms:
+            col = self.tokens[term]
+            _rows = self.presence.indices[self.presence.indptr[col]:self.presence.indptr[col+1]]
+            rows = _rows if rows is None else np.intersect1d(rows, _rows)
+        return np.sort(rows)
+
+    def query(self, search_terms, threshold=0.3, n_unkeywords=10):
+        """Expand the search terms, with arguments and return values as
+        for :obj:`keyword_expansion`."""
+        search_terms = search_terms.split()
+        foreground = self.background[self.search_docs(search_terms)]
+        foreground_sums = foreground.sum(axis=0)
+        scores = jlh_scores(foreground_sums, self.background_sums)
+        return _extract_keywords(self.features, self.vectorizer.vocabulary_, scores,
+                                 search_terms, threshold, n_unkeywords)
+
+    def save(self, filename):
+        with open(filename, 'wb') as f:
+            pickle.dump(self, f)
+
+    @staticmethod
+    def load(filename):
+        with open(filename, 'rb') as f:
+            return pickle.load(f)
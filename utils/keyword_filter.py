@@ -6,17 +6,25 @@ Filter, rank and save NewsAPI articles based on lists of keywords
 """
 
 from utils.datapath import datapath
-from utils.news_api import NEWSAPI_DATEFORMAT, NEWSAPI_TIMEFORMAT
-from datetime import datetime
-import pandas as pd
+from utils.term_matcher import TermMatcher
+from utils.parallel import map_shards
+from utils import metrics
+from utils.export import ranked_rows, write_xlsx
 import json
 import inflect
-from collections import Counter
+from functools import lru_cache
+import os
 
 INFLECT = inflect.engine()
+PLURAL_CACHE_SIZE = 10000
 
 
-def _expand_terms(first_terms, second_terms=[]):
+@lru_cache(maxsize=PLURAL_CACHE_SIZE)
+def _plural(word):
+    return INFLECT.plural(word)
+
+
+def _expand_terms(first_terms, second_terms=[], plural=_plural):
     """Expand pairs of sets of terms.
 
     Firstly, :obj:`second_terms` is expanded to include plural forms.
@@ -33,6 +41,7 @@ def _expand_terms(first_terms, second_terms=[]):
     Args:
         first_terms (list): List of first terms
         second_terms (list): List of second terms, which will also be pluralised.
+        plural (function): Pluralise a term (by default with a memoised :obj:`INFLECT`).
     Returns:
         expanded_terms (list): Flat list of expanded terms.
     """
@@ -40,28 +49,250 @@ def _expand_terms(first_terms, second_terms=[]):
     for first_term in first_terms:
         for second_term in second_terms:
             queries.append(f'{first_term} {second_term}')
-            queries.append(f'{first_term} {INFLECT.plural(second_term)}')
+            queries.append(f'{first_term} {plural(second_term)}')
     return queries
 
 
-def expand_terms(seed_terms):
+def expand_terms(seed_terms, plural=_plural):
     '''Expand all seed terms, each in the format described in
        :obj:`_expand_terms`.
 
     Args:
         seed_terms (list): List of :obj:`first_terms` and :obj:`second_terms`,
                            as described in :obj:`_expand_terms`.
+        plural (function): See :obj:`_expand_terms`.
     Returns:
         expanded_terms (list): Flat list of expanded terms.
     '''
     queries = []
     for terms in seed_terms:
-        queries += _expand_terms(*terms)
+        queries += _expand_terms(*terms, plural=plural)
     return queries
 
 
+class TermSet:
+    '''A deduplicated list of terms, with a compiled :obj:`TermMatcher`, which
+    can be passed as :obj:`core_terms` or :obj:`seed_terms` to
+    :obj:`filter_articles` in place of the raw term lists. Build one per term
+    configuration (e.g. with :obj:`from_seed_terms`), so that terms are expanded
+    and compiled once rather than on every call.
+
+    Note that repeated terms are only counted once, unlike in raw term lists.
+
+    Args:
+        terms (list): Flat list of (already expanded) terms.
+    '''
+    def __init__(self, terms):
+        self.terms = list(dict.fromkeys(terms))
+        self._matcher = None
+
+    def __len__(self):
+        return len(self.terms)
+
+    def __iter__(self):
+        return iter(self.terms)
+
+    def __eq__(self, other):
+        return isinstance(other, TermSet) and self.terms == other.terms
+
+    @property
+    def matcher(self):
+        ''':obj:`TermMatcher` of the terms, compiled on first use'''
+        if self._matcher is None:
+            self._matcher = TermMatcher(self.terms)
+        return self._matcher
+
+    @classmethod
+    def from_core_terms(cls, core_terms):
+        '''Term set of core terms, in the format of :obj:`filter_articles`'''
+        return cls(core_terms[0])
+
+    @classmethod
+    def from_seed_terms(cls, seed_terms, plurals=None):
+        '''Term set of seed terms, expanded as in :obj:`expand_terms`.
+
+        Args:
+            seed_terms (list): See :obj:`expand_terms`.
+            plurals (str): Path to a JSON file of plurals, which is read (if it
+                           exists) and updated with any new plurals.
+        '''
+        if plurals is None:
+            return cls(expand_terms(seed_terms))
+        cache = {}
+        if os.path.exists(plurals):
+            with open(plurals) as f:
+                cache = json.load(f)
+        n_cached = len(cache)
+
+        def plural(word):
+            if word not in cache:
+                cache[word] = _plural(word)
+            return cache[word]
+
+        term_set = cls(expand_terms(seed_terms, plural=plural))
+        if len(cache) > n_cached:
+            with open(plurals, 'w') as f:
+                json.dump(cache, f)
+        return term_set
+
+    def save(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.terms, f)
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename) as f:
+            return cls(json.load(f))
+
+    def __getstate__(self):
+        return dict(terms=self.terms, _matcher=None)  # Recompiled on first use
+
+
+def _core_terms(core_terms):
+    '''Flat list of core terms, from a :obj:`TermSet` or raw core terms'''
+    if isinstance(core_terms, TermSet):
+        return core_terms.terms
+    return core_terms[0]
+
+
+def _seed_terms(seed_terms):
+    '''Flat list of seed terms, from a :obj:`TermSet` or raw seed terms'''
+    if isinstance(seed_terms, TermSet):
+        return seed_terms.terms
+    return expand_terms(seed_terms)
+
+
+def _matcher(terms, flatten):
+    '''Compiled matcher of a :obj:`TermSet` (reused) or of raw terms'''
+    if isinstance(terms, TermSet):
+        return terms.matcher
+    return TermMatcher(flatten(terms))
+
+
+def _article_text(article):
+    '''Lowercased text of the article to be searched for terms: the content,
+    falling back on the description. Returns :obj:`None` if neither exist.'''
+    if article['content'] is None and article['description'] is None:
+        return None
+    elif article['content'] is None:
+        return article['description'].lower()
+    return article['content'].lower()
+
+
+def _score(_content, core_matcher, seed_matcher, min_core_df, min_seed_df):
+    '''Ranking score of the text, or :obj:`None` if it has too few core or seed terms'''
+    n_core = core_matcher.total(_content)
+    if n_core < min_core_df:
+        metrics.count('filter.rejected_core')
+        return None
+    n_seed = seed_matcher.total(_content)
+    if n_seed < min_seed_df:
+        metrics.count('filter.rejected_seed')
+        return None
+    return n_seed*n_core/len(_content)
+
+
+def _iter_texts(articles, near_duplicates=None):
+    '''Yield the position, text and article of each article which should be
+    scored, i.e. the first with each title, and only if it has text.'''
+    titles = set()  # Keep track of articles to avoid counting duplicates
+    for i, article in enumerate(articles):
+        title = hash(article['title'])
+        if title in titles:
+            metrics.count('filter.duplicates')
+            continue
+        titles.add(title)
+        _content = _article_text(article)
+        if _content is None:
+            metrics.count('filter.no_text')
+            continue
+        if near_duplicates is not None and near_duplicates.is_duplicate(article):
+            metrics.count('filter.near_duplicates')
+            continue
+        yield i, _content, article
+
+
+def iter_filter_articles(articles, core_terms, seed_terms,
+                         min_core_df=5, min_seed_df=None, near_duplicates=None):
+    '''Streaming version of :obj:`filter_articles`, which accepts any iterable
+    of articles (e.g. :obj:`news_api.get_articles` or
+    :obj:`article_store.iter_jsonl`) and yields each article which passes the
+    filter as soon as it has been scored. Only a hash of each title is
+    retained for deduplication, so memory usage doesn't grow with the
+    size of the articles.
+
+    Args:
+        articles (iterable): dicts (each article is the rawish
+                             response from NewsAPI)
+        core_terms, seed_terms, min_core_df, min_seed_df, near_duplicates:
+            See :obj:`filter_articles`.
+    Yields:
+        i, score, article: The position of the article in :obj:`articles`, its
+                           ranking score and the article itself.
+    '''
+    if min_seed_df is None:
+        min_seed_df = min_core_df
+    core_matcher = _matcher(core_terms, _core_terms)
+    seed_matcher = _matcher(seed_terms, _seed_terms)
+    for i, _content, article in _iter_texts(articles, near_duplicates):
+        score = _score(_content, core_matcher, seed_matcher, min_core_df, min_seed_df)
+        if score is not None:
+            yield i, score, article
+
+
+_WORKER = {}  # Matchers and thresholds, kept warm in each worker process
+
+
+def _init_worker(core_terms, seed_terms, min_core_df, min_seed_df):
+    _WORKER.update(core_matcher=_matcher(core_terms, _core_terms),
+                   seed_matcher=_matcher(seed_terms, _seed_terms),
+                   min_core_df=min_core_df, min_seed_df=min_seed_df)
+
+
+def _score_shard(shard):
+    '''Score a shard of (position, text) pairs in a worker process'''
+    scores = [(i, _score(_content, **_WORKER)) for i, _content in shard]
+    return [(i, score) for i, score in scores if score is not None]
+
+
+def _filter_parallel(articles, core_terms, seed_terms, n_jobs,
+                     min_core_df=5, min_seed_df=None, near_duplicates=None):
+    '''Equivalent of :obj:`filter_articles`, with scoring sharded across processes.
+    Deduplication is performed up front, so the results are identical.'''
+    if min_seed_df is None:
+        min_seed_df = min_core_df
+    texts = [(i, _content) for i, _content, _ in _iter_texts(articles, near_duplicates)]
+    return dict(map_shards(_score_shard, texts, n_jobs, initializer=_init_worker,
+                           initargs=(core_terms, seed_terms, min_core_df, min_seed_df)))
+
+
+def _filter_with_index(articles, core_terms, seed_terms, index,
+                       min_core_df=5, min_seed_df=None):
+    '''Equivalent of :obj:`filter_articles`, with terms counted by an :obj:`InvertedIndex`
+    of the articles, so that the text of the articles is not scanned.'''
+    if min_seed_df is None:
+        min_seed_df = min_core_df
+    n_core = index.counts(_core_terms(core_terms))
+    n_seed = index.counts(_seed_terms(seed_terms))
+    # Only the first article with each title is considered
+    first = {}
+    for i, article in enumerate(articles):
+        first.setdefault(article['title'], i)
+    candidates = n_core if min_core_df > 0 else index.lengths
+    ranked_articles = {}
+    for i in sorted(set(candidates) & set(first.values())):
+        if i not in index.lengths:  # i.e. no text
+            continue
+        _n_core, _n_seed = n_core.get(i, 0), n_seed.get(i, 0)
+        if _n_core < min_core_df or _n_seed < min_seed_df:
+            continue
+        ranked_articles[i] = _n_seed*_n_core/index.lengths[i]
+    return ranked_articles
+
+
 def filter_articles(articles, core_terms, seed_terms,
-                    min_core_df=5, min_seed_df=None):
+                    min_core_df=5, min_seed_df=None, near_duplicates=None,
+                    index=None, n_jobs=1):
     '''Filter articles by requiring minimum content of core (those used query
     hit NewsAPI) and seed terms (contextual keywords). Results are returned
     with a ranking score = (sum_core_terms * sum_seed_terms)/len(text).
@@ -69,115 +300,59 @@ def filter_articles(articles, core_terms, seed_terms,
     Args:
         articles (list): list of dict (each article is the rawish
                          response from NewsAPI)
-        core_terms (list): Terms used to query the NewsAPI
-        seed_terms (list): Context terms to further refine the articles.
+        core_terms (list): Terms used to query the NewsAPI, or a :obj:`TermSet`.
+        seed_terms (list): Context terms to further refine the articles (see
+                           :obj:`expand_terms`), or a :obj:`TermSet`.
         min_core_df (int): Minimum sum of occurences of core terms per article.
         min_seed_df (int): Minimum sum of occurences of seed terms per article.
                            If :obj:`None`, defaults to :obj:`min_core_df`.
+        near_duplicates (NearDuplicateIndex): If provided, also skip articles which are
+                                              near-duplicates of those already seen.
+                                              Use a new index for each call.
+        index (InvertedIndex): If provided, count terms (as whole words and phrases)
+                               with this index of :obj:`articles`, rather than
+                               scanning their text.
+        n_jobs (int): Number of processes over which to shard the scoring.
     Returns:
        articles (dict): Filtered set of articles, with associated rank.
     '''
-    if min_seed_df is None:
-        min_seed_df = min_core_df
-    expanded_seed_terms = expand_terms(seed_terms)
-    ranked_articles = {}
-    titles = set()  # Keep track of articles to avoid counting duplicates
-    for i, article in enumerate(articles):
-        if article['title'] in titles:
-            continue
-        titles.add(article['title'])
-        if article['content'] is None and article['description'] is None:
-            continue
-        elif article['content'] is None:
-            _content = article['description'].lower()
+    if index is not None and near_duplicates is not None:
+        raise ValueError('near_duplicates cannot be used with an index')
+    with metrics.timer('filter', n_jobs=n_jobs, index=index is not None):
+        if index is not None:
+            ranked_articles = _filter_with_index(articles, core_terms, seed_terms, index,
+                                                 min_core_df=min_core_df,
+                                                 min_seed_df=min_seed_df)
+        elif n_jobs > 1:
+            ranked_articles = _filter_parallel(articles, core_terms, seed_terms, n_jobs,
+                                               min_core_df=min_core_df,
+                                               min_seed_df=min_seed_df,
+                                               near_duplicates=near_duplicates)
         else:
-            _content = article['content'].lower()
-
-        n_core = sum(_content.count(term) for term in core_terms[0])
-        if n_core < min_core_df:
-            continue
-        n_seed = sum(_content.count(term) for term in expanded_seed_terms)
-        if n_seed < min_seed_df:
-            continue
-        ranked_articles[i] = n_seed*n_core/len(_content)
+            ranked_articles = {i: score for i, score, _ in
+                               iter_filter_articles(articles, core_terms, seed_terms,
+                                                    min_core_df=min_core_df,
+                                                    min_seed_df=min_seed_df,
+                                                    near_duplicates=near_duplicates)}
+    metrics.count('filter.accepted', len(ranked_articles))
     return ranked_articles
 
 
-def save_excel(ranked_articles, articles, label):
-    '''Save the ranked articles in a nicely formatted Excel file'''
-    output = []
-    titles = set()
-    for idx, rank in Counter(ranked_articles).most_common():
-        art = articles[idx]
-        if art['title'] in titles:
-            continue
-        titles.add(art['title'])
-        source = art.pop('source')['name']
-        publishedAt = datetime.strptime(art.pop('publishedAt'),
-                                        NEWSAPI_DATEFORMAT+NEWSAPI_TIMEFORMAT)
-        publishedAt = datetime.strftime(publishedAt, '%d/%m/%Y')
-        output.append(dict(score=rank, source=source,
-                           publishedAt=publishedAt, **art))
-    df = pd.DataFrame(output, columns=['publishedAt', 'score', 'source', 'title',
-                                       'author', 'description', 'content', 'url'])
+def save_excel(ranked_articles, articles, label, near_duplicates=None):
+    '''Save the ranked articles in a nicely formatted Excel file.
+    If a (new) :obj:`NearDuplicateIndex` is provided, then near-duplicates
+    of higher ranked articles are also left out.'''
     filename = datapath('outputs', f'{label}.xlsx')
-    df.to_excel(filename)
+    write_xlsx(ranked_rows(ranked_articles, articles, near_duplicates), filename)
 
 
 if __name__ == '__main__':
-    from utils.news_api import download_articles
-
-    # An OR of all of these terms is used for the API query
-    core_terms = [['nhs', 'national health service']]
-
-    # Format: Pairs of lists of form (A=[a0,..,an], B=[b0,...,bn])
-    # Firstly, B is expanded to include plural forms
-    # Then, all combinations of A and B are generated
-    # e.g. ['video'], ['chat', 'call'] --> ['video chat', 'video chats',
-    #                                       'video call', 'video calls']
-    # If B is missing then it is ignored
-    # e.g. ['triage online'] --> 'triage online'
-    #
-    # These terms are then searched for AFTER the API query for filtering articles
-    seed_terms = [[['digital'], ['transformation']],
-                  [['digital health']],
-                  [['health tech']],
-                  [['digital'] + ['technology']],
-                  [['video'], ['chat', 'call', 'consultation']],
-                  [['remote'], ['consultation', 'diagnosis', 'monitoring']],
-                  [['online', 'digital', 'phone'], ['consultation']],
-                  [['telecare', 'telemedicine', 'telehealth']],
-                  [['virtual medicine']],
-                  [['triage online']],
-                  [['online triage']],
-                  [['triaging patients online']],
-                  [['digital', 'virtual'], ['therapy', 'therapeutic']],
-                  [['electronic', 'digital'], ['prescribing']],
-                  [['patient data']],
-                  [['data sharing']],
-                  [['NHSX', 'NHS Digital']]]
-
-    # Core arguments for all API calls
-    initial_kwargs = dict(page_size=100,
-                          language='en',
-                          q=' OR '.join(f'("{term}")' for term in core_terms[0]),
-                          sort_by='publishedAt', verbose=True)
-
-    # Collect and save from June 2019 til present
-    label = 'nhs_since_june2019'
-    articles = download_articles(label, start='01 June, 2019',
-                                 **initial_kwargs)
-    ranked_articles = filter_articles(articles, core_terms, seed_terms,
-                                      min_core_df=4, min_seed_df=2) # Less tight requirements
-    filename = datapath('processed', f'filtered_{label}.json')
-    with open(filename, 'w') as f:
-        f.write(json.dumps(ranked_articles))
-
-    # Collect and save from March 2020 til present
-    label = 'nhs_since_march_2'
-    articles = download_articles('nhs_since_march_2', **initial_kwargs)
-    ranked_articles = filter_articles(articles, core_terms, seed_terms) # Default tight requirements
-    filename = datapath('processed', f'filtered_{label}.json')
-    with open(filename, 'w') as f:
-        f.write(json.dumps(ranked_articles))
-    save_excel(ranked_articles, articles, 'nhsx_digital_shift_news_v2')
+    # The terms and labels are configured in utils/configs/nhs_digital_shift.json
+    # (see utils.pipeline for the format). Seed terms are in the format of
+    # :obj:`expand_terms`, and are searched for AFTER the API query, which is an
+    # OR of the core terms, for filtering articles.
+    import sys
+    from utils.pipeline import main
+    config = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'configs', 'nhs_digital_shift.json')
+    main([config] + sys.argv[1:])
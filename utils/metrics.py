@@ -0,0 +1,155 @@
+'''
+metrics
+=======
+
+Lightweight instrumentation of the pipeline stages (collect, filter, tokenize,
+export) with timers and counters. Each measurement is passed as an event (dict)
+to any registered hooks, e.g. :obj:`json_hook` for structured JSON lines, and
+is tallied for :obj:`summary`.
+
+Instrumentation is disabled by default, in which case timers and counters
+return immediately. Worker processes of :obj:`parallel.map_shards` (e.g.
+:obj:`keyword_filter.filter_articles` with :obj:`n_jobs` > 1) record the
+totals of each shard without calling the hooks, and the totals are then
+recorded in the parent process by :obj:`merge`.
+
+e.g.
+
+    with metrics.recording(metrics.json_hook()):
+        articles = download_articles(label, **kwargs)
+        ranked_articles = filter_articles(articles, core_terms, seed_terms)
+    print(metrics.summary())
+'''
+
+from contextlib import contextmanager
+import threading
+import time
+import json
+import sys
+
+_STATE = dict(enabled=False, hooks=[], totals={})
+_LOCK = threading.Lock()
+
+
+def enable(*hooks):
+    '''Start recording, resetting the totals.
+
+    Args:
+        hooks: Functions which are called with each event (dict).
+    '''
+    with _LOCK:
+        _STATE.update(enabled=True, hooks=list(hooks), totals={})
+
+
+def disable():
+    '''Stop recording. The totals are kept until the next :obj:`enable`.'''
+    _STATE['enabled'] = False
+
+
+def enabled():
+    return _STATE['enabled']
+
+
+@contextmanager
+def recording(*hooks):
+    '''Record within a block (see :obj:`enable`)'''
+    enable(*hooks)
+    try:
+        yield
+    finally:
+        disable()
+
+
+def _emit(kind, name, value, labels, n=1):
+    event = dict(type=kind, name=name, value=value, time=time.time(), labels=labels)
+    with _LOCK:
+        total = _STATE['totals'].setdefault(name, dict(type=kind, count=0, total=0))
+        total['count'] += n
+        total['total'] += value
+        for hook in _STATE['hooks']:
+            hook(event)
+
+
+def count(name, value=1, **labels):
+    '''Add to a counter.
+
+    Args:
+        name (str): Name of the counter, e.g. "api.pages".
+        value (int): Amount to add.
+        labels: Any details of this measurement, e.g. the date chunk.
+    '''
+    if _STATE['enabled']:
+        _emit('counter', name, value, labels)
+
+
+class _Timer:
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        _emit('timer', self.name, time.perf_counter() - self.start, self.labels)
+        return False
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(name, **labels):
+    '''Time a block, in seconds, e.g. :obj:`with timer('filter'): ...`
+
+    Args:
+        name (str): Name of the timer.
+        labels: Any details of this measurement.
+    '''
+    if not _STATE['enabled']:
+        return _NULL_TIMER
+    return _Timer(name, labels)
+
+
+def summary():
+    '''Totals of each counter and timer since the last :obj:`enable`.
+
+    Returns:
+        summary (dict): Mapping of name --> dict of type, count (number of
+                        measurements) and total (sum of values), and also the
+                        mean for timers.
+    '''
+    with _LOCK:
+        totals = {name: dict(total) for name, total in _STATE['totals'].items()}
+    for total in totals.values():
+        if total['type'] == 'timer':
+            total['mean'] = total['total']/total['count']
+    return totals
+
+
+def merge(totals):
+    '''Record the totals of measurements made in another process, e.g.
+    a worker process, as one event per name.
+
+    Args:
+        totals (dict): Totals from :obj:`summary` in the other process.
+    '''
+    if _STATE['enabled']:
+        for name, total in totals.items():
+            _emit(total['type'], name, total['total'],
+                  dict(measurements=total['count']), n=total['count'])
+
+
+def json_hook(stream=None):
+    '''Hook which writes each event as a line of JSON (default=to stderr)'''
+    def hook(event):
+        (sys.stderr if stream is None else stream).write(json.dumps(event) + '\n')
+    return hook
@@ -0,0 +1,122 @@
+'''
+near_duplicates
+===============
+
+Detect near-duplicate articles (e.g. syndicated stories with slightly different
+titles, or with a trailing " - Source" in the title) with MinHash signatures
+of shingled title and content, and locality sensitive hashing (LSH) so that
+each lookup only compares against a few candidate articles.
+'''
+
+import numpy as np
+import zlib
+import re
+
+PRIME = 4294967291  # Largest prime below 2**32, so hashes never overflow uint64
+SOURCE_SUFFIX = re.compile(r'\s+[-|–—]\s+[^-|–—]+$')  # e.g. " - BBC News"
+TRUNCATION = re.compile(r'\s*(…\s*)?\[\+\d+ chars\]$')  # e.g. "... [+1234 chars]"
+
+
+def article_text(article):
+    '''Normalised title and content of an article, for comparison'''
+    title = SOURCE_SUFFIX.sub('', article.get('title') or '')
+    content = article.get('content') or article.get('description') or ''
+    content = TRUNCATION.sub('', content)
+    return f'{title} {content}'.lower()
+
+
+def shingles(text, size=3):
+    '''Set of word n-grams (of length :obj:`size`) in the text'''
+    tokens = re.findall(r'\w+', text)
+    if len(tokens) <= size:
+        return {' '.join(tokens)}
+    return {' '.join(tokens[i:i+size]) for i in range(len(tokens) - size + 1)}
+
+
+class NearDuplicateIndex:
+    '''Index of articles for finding near-duplicates of new articles.
+
+    Articles are near-duplicates if the estimated Jaccard similarity of
+    their shingles is at least :obj:`threshold`. The signature is split into
+    :obj:`bands` bands, and only articles which share a band exactly are
+    compared, which will find pairs with similarity above roughly
+    (1/bands)**(bands/num_perm).
+
+    Args:
+        threshold (float): Minimum Jaccard similarity of near-duplicates.
+        num_perm (int): Number of hash permutations in each MinHash signature.
+        bands (int): Number of LSH bands. Must divide :obj:`num_perm`.
+        shingle_size (int): Number of words per shingle.
+        seed (int): Seed for generating the hash permutations.
+    '''
+    def __init__(self, threshold=0.8, num_perm=128, bands=32, shingle_size=3, seed=0):
+        if num_perm % bands != 0:
+            raise ValueError(f'bands ({bands}) must divide num_perm ({num_perm})')
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.rows = num_perm // bands
+        random_state = np.random.RandomState(seed)
+        self._a = random_state.randint(1, PRIME, size=(num_perm, 1), dtype=np.uint64)
+        self._b = random_state.randint(0, PRIME, size=(num_perm, 1), dtype=np.uint64)
+        self._buckets = [{} for _ in range(bands)]
+        self._signatures = []
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def signature(self, article):
+        '''MinHash signature of an article'''
+        hashes = np.array([zlib.crc32(shingle.encode())
+                           for shingle in shingles(article_text(article),
+                                                   self.shingle_size)],
+                          dtype=np.uint64) % PRIME
+        return ((self._a*hashes + self._b) % PRIME).min(axis=1)
+
+    def _band_keys(self, signature):
+        return [signature[i*self.rows:(i+1)*self.rows].tobytes()
+                for i in range(len(self._buckets))]
+
+    def find(self, article, signature=None):
+        '''Find a near-duplicate of the article in the index.
+
+        Args:
+            article (dict): Article in the NewsAPI format.
+            signature (np.array): Signature of the article, if already calculated.
+        Returns:
+            idx (int): Id of the first near-duplicate added to the index,
+                       or :obj:`None` if there is none.
+        '''
+        if signature is None:
+            signature = self.signature(article)
+        candidates = set()
+        for bucket, key in zip(self._buckets, self._band_keys(signature)):
+            candidates.update(bucket.get(key, []))
+        for idx in sorted(candidates):
+            if (self._signatures[idx] == signature).mean() >= self.threshold:
+                return idx
+        return None
+
+    def add(self, article, signature=None):
+        '''Add an article to the index, returning its id'''
+        if signature is None:
+            signature = self.signature(article)
+        idx = len(self._signatures)
+        self._signatures.append(signature)
+        for bucket, key in zip(self._buckets, self._band_keys(signature)):
+            bucket.setdefault(key, []).append(idx)
+        return idx
+
+    def is_duplicate(self, article):
+        '''Check whether the article is a near-duplicate of any article in the
+        index. If it isn't, then add it to the index.
+
+        Args:
+            article (dict): Article in the NewsAPI format.
+        Returns:
+            is_duplicate (bool)
+        '''
+        signature = self.signature(article)
+        if self.find(article, signature=signature) is not None:
+            return True
+        self.add(article, signature=signature)
+        return False
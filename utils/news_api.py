@@ -2,43 +2,116 @@
 news_api
 ========
 
-Collect data from NewsAPI in week chunks.
+Collect data from NewsAPI in week chunks, or in date windows adapted
+to the number of results.
 '''
 
 from utils.secrets import news_api_key
 from utils.datapath import datapath
+from utils.article_store import write_store
+from utils import metrics
 from newsapi import NewsApiClient
 from newsapi.newsapi_exception import NewsAPIException
 from dateutil import rrule
 from datetime import datetime, timedelta
 from pandas import Timestamp
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+import time
 import os
 import json
 
 NEWSAPI_DATEFORMAT = '%Y-%m-%d'
 NEWSAPI_TIMEFORMAT = 'T%H:%M:%SZ'
+TRANSIENT_ERROR_CODES = {'rateLimited', 'unexpectedError'}
+EXECUTION_KWARGS = {'verbose', 'backoff'}  # Don't affect the articles, so aren't part of the query
 
 
-def get_articles(verbose=False, **kwargs):
+class TokenBucket:
+    '''Thread-safe token bucket rate limiter.
+
+    Args:
+        rate (float): Number of tokens added to the bucket per second.
+        capacity (int): Maximum number of tokens in the bucket (i.e. the
+                        largest permitted burst). Default=1.
+    '''
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        '''Block until a token is available, and then take it.'''
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity,
+                                  self.tokens + (now - self.updated)*self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens)/self.rate
+            time.sleep(wait)
+
+
+def _is_transient(exception):
+    '''Whether a NewsAPIException is worth retrying'''
+    details = exception.get_exception()
+    return isinstance(details, dict) and details.get('code') in TRANSIENT_ERROR_CODES
+
+
+def _get_everything(newsapi, rate_limiter=None, max_retries=0, backoff=1, **kwargs):
+    '''Call NewsApiClient.get_everything, waiting for the rate limiter (if any)
+    and retrying with exponential backoff on transient errors.'''
+    for attempt in range(max_retries + 1):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            with metrics.timer('api.request'):
+                return newsapi.get_everything(**kwargs)
+        except NewsAPIException as exception:
+            if attempt == max_retries or not _is_transient(exception):
+                raise exception
+        metrics.count('api.retries')
+        time.sleep(backoff * 2**attempt)
+
+
+def get_articles(verbose=False, newsapi=None, rate_limiter=None, max_retries=0,
+                 backoff=1, **kwargs):
     """Hit the NewsAPI via the get_everything method.
     Use this function as you would the NewsApiClient.get_everything method.
 
+    Args:
+        verbose (bool): Print the number of results found.
+        newsapi (NewsApiClient): Client to reuse for all pages. Default=a new client.
+        rate_limiter (TokenBucket): Optional rate limiter, shared between threads.
+        max_retries (int): Number of retries for transient NewsAPIExceptions.
+        backoff (float): Seconds to wait before the first retry, doubling thereafter.
+        kwargs: All other kwargs to pass to NewsApiClient.get_everything
     Yields:
         One article at a time, buffered from NewsAPI.
     """
     results_so_far = 0
     total_results = None
     kwargs['page'] = 1
-    while results_so_far != total_results and kwargs['page'] < 100:        
-        newsapi = NewsApiClient(api_key=news_api_key())  # NB: news_api_key is cached
+    if newsapi is None:
+        newsapi = NewsApiClient(api_key=news_api_key(), session=requests.Session())
+    while results_so_far != total_results and kwargs['page'] < 100:
         try:
-            results = newsapi.get_everything(**kwargs)
+            results = _get_everything(newsapi, rate_limiter=rate_limiter,
+                                      max_retries=max_retries, backoff=backoff,
+                                      **kwargs)
         except NewsAPIException as exception:
             if 'Developer accounts are limited to a max of 100 results' in str(exception):
                 break
             raise exception
         if total_results is None and verbose:
             print(f"{results['totalResults']} results found for {kwargs}")
+        metrics.count('api.pages', from_param=kwargs.get('from_param'), to=kwargs.get('to'))
         for article in results['articles']:
             yield article
         total_results = results['totalResults']
@@ -55,8 +128,7 @@ def weekchunks(start, until=None):
     Returns:
         chunk_pairs (list): List of pairs of string, representing the start and end of weeks.
     '''
-    if until is None:
-        until = datetime.now()
+    until = datetime.now() if until is None else Timestamp(until).to_pydatetime()
     start = Timestamp(start).to_pydatetime()
     chunks = [datetime.strftime(_date, NEWSAPI_DATEFORMAT)
               for _date in rrule.rrule(rrule.WEEKLY, dtstart=start,
@@ -67,33 +139,240 @@ def weekchunks(start, until=None):
     return chunk_pairs
 
 
-def download_articles(label, start='March 01, 2020',
-                      until=None, **initial_kwargs):
-    '''Download articles from NewsAPI and save to json, between two dates. 
-    If already downloaded, just load up the articles.
+def _format_datetime(_datetime):
+    '''Format a datetime for the from_param and to params (which don't accept the "Z")'''
+    return datetime.strftime(_datetime, NEWSAPI_DATEFORMAT+NEWSAPI_TIMEFORMAT.rstrip('Z'))
+
+
+def _timestamp(datestring):
+    '''Parse either of the date formats sent to NewsAPI'''
+    return Timestamp(datestring).to_pydatetime()
+
+
+def _total_results(newsapi, from_param, to, rate_limiter=None, max_retries=0,
+                   backoff=1, **kwargs):
+    '''Number of results in a date window, for the cost of a single result'''
+    kwargs = {k: v for k, v in kwargs.items() if k != 'verbose'}
+    kwargs.update(from_param=_format_datetime(from_param), to=_format_datetime(to),
+                  page=1, page_size=1)
+    results = _get_everything(newsapi, rate_limiter=rate_limiter,
+                              max_retries=max_retries, backoff=backoff, **kwargs)
+    return results['totalResults']
+
+
+def plan_windows(start, until=None, max_results=100, min_window=timedelta(hours=1),
+                 newsapi=None, **kwargs):
+    '''Plan date windows between two dates, such that each window contains no
+    more than :obj:`max_results` results (and so won't be truncated by NewsAPI).
+    Windows are split in half recursively until they are small enough, according
+    to the `totalResults` of the query over the window, and then neighbouring
+    windows are merged whilst their combined results are small enough.
+    Windows shorter than :obj:`min_window` are not split any further, even if
+    they contain more than :obj:`max_results` results.
+
+    Args:
+        start (str): Sensibly formatted datestring (format to be guessed by pd)
+        until (str): Another datestring. Default=now.
+        max_results (int): Maximum number of results per window. Default=100, the
+                           limit for developer accounts. Otherwise, NewsAPI returns
+                           at most 99 pages (i.e. 99 x page_size results).
+        min_window (timedelta): Shortest window to be considered.
+        newsapi (NewsApiClient): Client to reuse for all requests. Default=a new client.
+        kwargs: All other kwargs to pass to :obj:`get_articles` (e.g. the query)
+    Returns:
+        windows (list): List of pairs of string, representing the start and end of windows.
+    '''
+    if newsapi is None:
+        newsapi = NewsApiClient(api_key=news_api_key(), session=requests.Session())
+    start = Timestamp(start).to_pydatetime()
+    until = datetime.now() if until is None else Timestamp(until).to_pydatetime()
+
+    def split(_start, _until, total):
+        if total <= max_results or _until - _start <= min_window:
+            leaves.append([_start, _until, total])
+            return
+        middle = (_start + (_until - _start)/2).replace(microsecond=0)
+        for window in [(_start, middle), (middle, _until)]:
+            split(*window, _total_results(newsapi, *window, **kwargs))
+
+    leaves = []
+    split(start, until, _total_results(newsapi, start, until, **kwargs))
+
+    # Merge sparse neighbours
+    windows = leaves[:1]
+    for _start, _until, total in leaves[1:]:
+        if windows[-1][2] + total <= max_results:
+            windows[-1][1] = _until
+            windows[-1][2] += total
+        else:
+            windows.append([_start, _until, total])
+    return [(_format_datetime(_start), _format_datetime(_until))
+            for _start, _until, _ in windows]
+
+
+def _missing_chunks(chunks, windows):
+    '''Chunks which are not already covered by the union of the windows'''
+    covered = []  # Non-overlapping spans of time
+    for from_param, to in sorted((_timestamp(a), _timestamp(b)) for a, b in windows):
+        if covered and from_param <= covered[-1][1]:
+            covered[-1][1] = max(covered[-1][1], to)
+        else:
+            covered.append([from_param, to])
+    return [(from_param, to) for from_param, to in chunks
+            if not any(a <= _timestamp(from_param) and _timestamp(to) <= b
+                       for a, b in covered)]
+
+
+def _overlapping_chunks(chunks, weeks):
+    '''Chunks which overlap the span of the weeks (e.g. from :obj:`weekchunks`)'''
+    if not weeks:
+        return []
+    start, until = _timestamp(weeks[0][0]), _timestamp(weeks[-1][1])
+    return [chunk for chunk in chunks
+            if _timestamp(chunk[0]) < until and _timestamp(chunk[1]) > start]
+
+
+def _contiguous(chunks):
+    '''Merge consecutive chunks into spans'''
+    spans = []
+    for from_param, to in chunks:
+        if spans and spans[-1][1] == from_param:
+            spans[-1][1] = to
+        else:
+            spans.append([from_param, to])
+    return spans
+
+
+def _download_chunk(from_param, to, **kwargs):
+    '''Download all articles in a single date chunk'''
+    with metrics.timer('download.chunk', from_param=from_param, to=to):
+        articles = list(get_articles(from_param=from_param, to=to, **kwargs))
+    metrics.count('download.articles', len(articles), from_param=from_param, to=to)
+    return articles
+
+
+def _write_json(data, filename):
+    '''Write JSON atomically, so that a crash never leaves a partial file'''
+    tmp_filename = f'{filename}.tmp'
+    with open(tmp_filename, 'w') as f:
+        f.write(json.dumps(data))
+    os.replace(tmp_filename, filename)
+
+
+def _load_manifest(chunk_dir):
+    '''Load the manifest of the chunks already downloaded for this label'''
+    filename = os.path.join(chunk_dir, 'manifest.json')
+    if not os.path.isfile(filename):
+        return dict(query=None, chunks=[])
+    with open(filename) as f:
+        return json.load(f)
+
+
+def _chunk_filename(chunk_dir, from_param, to):
+    return os.path.join(chunk_dir, f'{from_param}_{to}.json'.replace(':', ''))
+
+
+def download_articles(label, start='March 01, 2020', until=None,
+                      n_workers=1, rate_limit=None, max_retries=3, backoff=1,
+                      adaptive=False, max_results=100, near_duplicates=None,
+                      **initial_kwargs):
+    '''Download articles from NewsAPI and save to json, between two dates.
+
+    Each week chunk (or, if :obj:`adaptive`, each window from
+    :obj:`plan_windows`) is saved under data/raw/{label}/ as soon as it has been
+    downloaded, and recorded in data/raw/{label}/manifest.json. Subsequent calls
+    only download weeks which are not covered by the manifest (e.g. after a
+    crash, or new weeks since the last call), and the corpus of the
+    downloaded chunks which overlap the weeks between :obj:`start` and
+    :obj:`until` is then saved to data/raw/{label}.json and to the article
+    store data/raw/{label}.arrow (see :obj:`article_store`). If these are the
+    same chunks as were last saved, data/raw/{label}.json is just loaded up,
+    as it is if it exists without a manifest (i.e. it predates the chunk cache).
+    The manifest records the query, and a label can't be reused for a
+    different query.
 
     Args:
         label (str): Label used to save the JSON output (don't include the .json)
         start (str): Sensibly formatted datestring (format to be guessed by pd)
         until (str): Another datestring. Default=today.
-        news_api_kwargs (**kwargs): All other kwargs to pass to NewsApiClient.get_everything (e.g. the query)    
+        n_workers (int): Number of week chunks to download concurrently.
+        rate_limit (float): Maximum number of API requests per second, across all workers.
+                            Default=unlimited.
+        max_retries (int): Number of retries per request for transient NewsAPIExceptions.
+        backoff (float): Seconds to wait before the first retry, doubling thereafter.
+        adaptive (bool): Download in windows planned by :obj:`plan_windows`,
+                         rather than in week chunks.
+        max_results (int): See :obj:`plan_windows`, if :obj:`adaptive`.
+        near_duplicates (NearDuplicateIndex): If provided, also leave out articles which
+                                              are near-duplicates of earlier articles.
+                                              Use a new index for each call.
+        news_api_kwargs (**kwargs): All other kwargs to pass to NewsApiClient.get_everything (e.g. the query)
     Returns:
         articles
     '''
     filename = datapath('raw', f'{label}.json')
-    titles = set()
-    if not os.path.isfile(filename):
-        articles = []
-        for from_param, to in weekchunks(start, until):
-            kwargs = dict(from_param=from_param, to=to, **initial_kwargs)
-            for art in get_articles(**kwargs):
-                if art['title'] in titles:
-                    continue
-                titles.add(art['title'])
-                articles.append(art)
-        with open(filename, 'w') as f:
-            f.write(json.dumps(articles))
-    else:
+    store_filename = datapath('raw', f'{label}.arrow')
+    chunk_dir = datapath('raw', label)
+    if os.path.isfile(filename) and not os.path.isdir(chunk_dir):
+        with open(filename) as f:
+            return json.load(f)
+    os.makedirs(chunk_dir, exist_ok=True)
+
+    # Download any chunks which haven't been downloaded yet
+    manifest = _load_manifest(chunk_dir)
+    query = json.loads(json.dumps({k: v for k, v in initial_kwargs.items()
+                                   if k not in EXECUTION_KWARGS}))
+    if manifest['query'] is not None and \
+            {k: v for k, v in manifest['query'].items() if k not in EXECUTION_KWARGS} != query:
+        raise ValueError(f'{chunk_dir} was downloaded with the query {manifest["query"]}, '
+                         f'not {query}. Use a new label for a new query.')
+    manifest['query'] = query
+    weeks = weekchunks(start, until)
+    missing = _missing_chunks(weeks, manifest['chunks'])
+    rate_limiter = None if rate_limit is None else TokenBucket(rate_limit)
+    kwargs = dict(rate_limiter=rate_limiter, max_retries=max_retries, backoff=backoff,
+                  **initial_kwargs)
+    if adaptive and missing:
+        newsapi = NewsApiClient(api_key=news_api_key(), session=requests.Session())
+        missing = [window for span in _contiguous(missing)
+                   for window in plan_windows(*span, max_results=max_results,
+                                              newsapi=newsapi, **kwargs)]
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        futures = {executor.submit(_download_chunk, *chunk, **kwargs): chunk
+                   for chunk in missing}
+        for future in as_completed(futures):
+            chunk = futures[future]
+            _write_json(future.result(), _chunk_filename(chunk_dir, *chunk))
+            manifest['chunks'] = sorted(manifest['chunks'] + [list(chunk)])
+            _write_json(manifest, os.path.join(chunk_dir, 'manifest.json'))
+
+    # The merged corpus only needs rebuilding if it was merged from other chunks,
+    # or if it was (or is to be) filtered for near-duplicates
+    chunks = _overlapping_chunks(manifest['chunks'], weeks)
+    merged = dict(chunks=chunks, near_duplicates=near_duplicates is not None)
+    if (manifest.get('merged') == merged and os.path.isfile(filename)
+            and os.path.isfile(store_filename)):
         with open(filename) as f:
-            articles = json.load(f)
+            return json.load(f)
+
+    # Chunks are merged in date order, so that deduplication
+    # is independent of the order in which chunks were downloaded
+    articles = []
+    titles = set()
+    for chunk in chunks:
+        with open(_chunk_filename(chunk_dir, *chunk)) as f:
+            chunk_articles = json.load(f)
+        for art in chunk_articles:
+            if art['title'] in titles:
+                metrics.count('download.duplicates')
+                continue
+            titles.add(art['title'])
+            if near_duplicates is not None and near_duplicates.is_duplicate(art):
+                metrics.count('download.near_duplicates')
+                continue
+            articles.append(art)
+    _write_json(articles, filename)
+    write_store(articles, store_filename)
+    manifest['merged'] = merged
+    _write_json(manifest, os.path.join(chunk_dir, 'manifest.json'))
     return articles
@@ -0,0 +1,52 @@
+'''
+parallel
+========
+
+Sharded execution of per-document work across a pool of processes.
+'''
+
+from utils import metrics
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+
+def shards(items, n_shards):
+    '''Split a list into (at most) :obj:`n_shards` contiguous shards'''
+    size = max(1, -(-len(items) // n_shards))  # Ceiling division
+    return [items[i:i+size] for i in range(0, len(items), size)]
+
+
+def _run_shard(function, record_metrics, shard):
+    '''Apply a function to a shard in a worker process, and return its results
+    and the totals of any measurements made (see :obj:`metrics.merge`)'''
+    if not record_metrics:
+        metrics.disable()
+        return function(shard), {}
+    metrics.enable()  # Reset the totals, and drop any hooks inherited from the parent
+    return function(shard), metrics.summary()
+
+
+def map_shards(function, items, n_jobs, initializer=None, initargs=(),
+               shards_per_job=4):
+    '''Apply a function to shards of a list in a pool of processes, and
+    concatenate the results in the original order.
+
+    Args:
+        function: Picklable function which takes a shard (list) and returns a list.
+        items (list): Items to be processed.
+        n_jobs (int): Number of processes.
+        initializer: Picklable function run once in each process, e.g. to load a model.
+        initargs (tuple): Arguments for :obj:`initializer`.
+        shards_per_job (int): Number of shards per process, for load balancing.
+    Returns:
+        results (list): Concatenated results of :obj:`function` over the shards.
+    '''
+    results = []
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=initializer,
+                             initargs=initargs) as executor:
+        run_shard = partial(_run_shard, function, metrics.enabled())
+        for shard_results, totals in executor.map(run_shard,
+                                                  shards(items, n_jobs*shards_per_job)):
+            results += shard_results
+            metrics.merge(totals)
+    return results
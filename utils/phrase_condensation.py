@@ -0,0 +1,207 @@
+'''
+phrase_condensation
+===================
+
+Condense phrases into groups of similar phrases (and a thesaurus of
+phrase --> group leader) by the cosine similarity of their embeddings.
+
+Encoders are pluggable: any object with a :obj:`name` (identifying the
+embedding, for caching) and an :obj:`encode` method, which maps a list of
+phrases onto an array of embeddings. :obj:`HashingEncoder` and
+:obj:`TfidfEncoder` are local, and :obj:`FunctionEncoder` wraps any other
+model, e.g. a sentence encoder from TF Hub:
+
+    encoder = FunctionEncoder(lambda phrases: np.asarray(model(phrases)), name='use-4')
+    groups, thesaurus = condense_phrases(phrases, encoder, cache='embeddings.db')
+
+Similarities are calculated in blocks of rows by matrix multiplication, so
+memory grows with block_size x n_phrases rather than n_phrases**2, or
+optionally only between phrases sharing a bucket of random hyperplane LSH.
+'''
+
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+from contextlib import nullcontext
+from collections import defaultdict
+import numpy as np
+import hashlib
+import shelve
+
+
+class HashingEncoder:
+    '''Embed phrases by hashing their character n-grams. Stateless, so it
+    needs no training data, but only captures similarity of spelling.
+
+    Args:
+        n_features (int): Number of dimensions of the embeddings.
+        vectorizer_kwargs: Keyword arguments for the HashingVectorizer.
+    '''
+    def __init__(self, n_features=2**12, **vectorizer_kwargs):
+        vectorizer_kwargs = dict(dict(analyzer='char_wb', ngram_range=(2, 4),
+                                      alternate_sign=False), **vectorizer_kwargs)
+        self.vectorizer = HashingVectorizer(n_features=n_features, **vectorizer_kwargs)
+        params = sorted(vectorizer_kwargs.items())
+        self.name = f'hashing-{n_features}-{params}'
+
+    def encode(self, phrases):
+        return self.vectorizer.transform(phrases).toarray().astype(np.float32)
+
+
+class TfidfEncoder:
+    '''Embed phrases as TF-IDF vectors of a vectorizer fitted to a corpus.
+
+    Args:
+        corpus (list): Texts (str) to which the vectorizer is fitted.
+        vectorizer_kwargs: Keyword arguments for the TfidfVectorizer.
+    '''
+    def __init__(self, corpus, **vectorizer_kwargs):
+        self.vectorizer = TfidfVectorizer(**vectorizer_kwargs).fit(corpus)
+        vocabulary = sorted(self.vectorizer.vocabulary_.items())
+        fingerprint = hashlib.sha1(str((vocabulary, self.vectorizer.idf_.tolist(),
+                                        sorted(vectorizer_kwargs.items()))).encode())
+        self.name = f'tfidf-{fingerprint.hexdigest()[:16]}'
+
+    def encode(self, phrases):
+        return self.vectorizer.transform(phrases).toarray().astype(np.float32)
+
+
+class FunctionEncoder:
+    '''Embed phrases with any function mapping a list of phrases onto an array.
+
+    Args:
+        function: The embedding function, e.g. a TF Hub model.
+        name (str): Unique name of the embedding, for caching.
+    '''
+    def __init__(self, function, name):
+        self.function = function
+        self.name = name
+
+    def encode(self, phrases):
+        return np.asarray(self.function(phrases), dtype=np.float32)
+
+
+def embed(phrases, encoder, cache=None):
+    '''Embed phrases, optionally with an on-disk cache (:obj:`shelve`) of
+    embeddings keyed by encoder and phrase, so that only phrases missing from
+    the cache are encoded.
+
+    Args:
+        phrases (list): Phrases (str) to embed.
+        encoder: See the module docstring.
+        cache (str): Optional path to the cache.
+    Returns:
+        embeddings (np.array): One row per phrase.
+    '''
+    with (shelve.open(cache) if cache is not None else nullcontext({})) as _cache:
+        keys = [f'{encoder.name}:{phrase}' for phrase in phrases]
+        missing = {key: phrase for key, phrase in zip(keys, phrases) if key not in _cache}
+        embedded = {}
+        if missing:
+            embedded = dict(zip(missing, encoder.encode(list(missing.values()))))
+            for key, embedding in embedded.items():
+                _cache[key] = embedding
+        return np.array([embedded[key] if key in embedded else _cache[key]
+                         for key in keys])
+
+
+def normalise(embeddings):
+    '''Scale each row to unit length (leaving rows of zeros as zeros)'''
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return np.divide(embeddings, norms, out=np.zeros_like(embeddings), where=norms > 0)
+
+
+def remove_stop_prefixes(phrase, stops):
+    '''Remove stop words from the front of a phrase, e.g. "the nhs app"
+    --> "nhs app", which improves the cosine similarity of embeddings.'''
+    words = phrase.split(' ')
+    while len(words) > 1 and words[0] in stops:
+        words = words[1:]
+    return ' '.join(words)
+
+
+def _blocked_similarities(embeddings, block_size):
+    '''Yield the row indexes and cosine similarities of each block of
+    rows against all rows, for normalised embeddings.'''
+    for start in range(0, len(embeddings), block_size):
+        rows = np.arange(start, min(start + block_size, len(embeddings)))
+        yield rows, embeddings[rows] @ embeddings.T
+
+
+def _lsh_buckets(embeddings, n_planes, n_tables, seed):
+    '''Bucket the rows by their signs against random hyperplanes, in
+    :obj:`n_tables` independent tables.'''
+    rng = np.random.RandomState(seed)
+    powers = 1 << np.arange(n_planes)
+    tables = []
+    for _ in range(n_tables):
+        planes = rng.normal(size=(embeddings.shape[1], n_planes)).astype(embeddings.dtype)
+        keys = ((embeddings @ planes) > 0) @ powers
+        buckets = defaultdict(list)
+        for irow, key in enumerate(keys):
+            buckets[key].append(irow)
+        tables.append((keys, buckets))
+    return tables
+
+
+def _ann_similarities(embeddings, n_planes, n_tables, seed):
+    '''Yield the row index, candidate neighbours and their cosine
+    similarities for each row, with candidates found by LSH.'''
+    tables = _lsh_buckets(embeddings, n_planes, n_tables, seed)
+    for irow in range(len(embeddings)):
+        candidates = np.unique(np.concatenate([buckets[keys[irow]]
+                                               for keys, buckets in tables]))
+        yield irow, candidates, embeddings[candidates] @ embeddings[irow]
+
+
+def condense_phrases(phrases, encoder, threshold=0.79, cache=None, stops=None,
+                     block_size=1024, ann=False, n_planes=16, n_tables=8, seed=0):
+    '''Find groups of similar phrases (and a corresponding thesaurus). Each
+    phrase, in order, which hasn't yet been grouped becomes the leader of a
+    group of all ungrouped phrases whose similarity is above the threshold.
+
+    Args:
+        phrases (list): Phrases (str), e.g. in order of importance.
+        encoder: See the module docstring.
+        threshold (float): Minimum cosine similarity of grouped phrases.
+        cache (str): Optional path to an embedding cache (see :obj:`embed`).
+        stops (set): If provided, stop words are removed from the front of phrases
+                     before embedding (see :obj:`remove_stop_prefixes`).
+        block_size (int): Number of rows of similarities calculated at once.
+        ann (bool): Only compare phrases which share an LSH bucket, rather
+                    than all pairs. Faster for many phrases, but approximate.
+        n_planes (int): Number of hyperplanes per LSH table, if :obj:`ann`.
+                        More planes give smaller buckets.
+        n_tables (int): Number of LSH tables, if :obj:`ann`. More tables
+                        miss fewer similar pairs.
+        seed (int): Seed for the LSH hyperplanes, if :obj:`ann`.
+    Returns:
+        groups (dict): Mapping of leader --> list of phrases in its group.
+        thesaurus (dict): Mapping of grouped phrase --> leader.
+    '''
+    phrases = list(phrases)
+    groups, thesaurus = defaultdict(list), {}
+    if not phrases:
+        return groups, thesaurus
+    texts = phrases if stops is None else [remove_stop_prefixes(p, stops) for p in phrases]
+    embeddings = normalise(embed(texts, encoder, cache=cache))
+    grouped = np.zeros(len(phrases), dtype=bool)
+
+    def add_group(irow, candidates, similarities):
+        members = candidates[(similarities > threshold) & ~grouped[candidates]]
+        members = members[members != irow]
+        grouped[members] = True
+        for imember in members:
+            groups[phrases[irow]].append(phrases[imember])
+            thesaurus[phrases[imember]] = phrases[irow]
+
+    if ann:
+        for irow, candidates, similarities in _ann_similarities(embeddings, n_planes,
+                                                                n_tables, seed):
+            if not grouped[irow]:
+                add_group(irow, candidates, similarities)
+        return groups, thesaurus
+    columns = np.arange(len(phrases))
+    for rows, similarities in _blocked_similarities(embeddings, block_size):
+        for irow, row_similarities in zip(rows, similarities):
+            if not grouped[irow]:
+                add_group(irow, columns, row_similarities)
+    return groups, thesaurus
@@ -0,0 +1,121 @@
+'''
+phrase_counter
+==============
+
+Count condensed phrases in articles, longest phrases first, so that a
+phrase is not also counted as each of the shorter phrases within it
+(e.g. "nhs app" is not also counted as "app"). Phrases can be mapped onto
+a canonical phrase with a thesaurus, and the counts of many articles
+collected into a sparse count matrix (e.g. for topic modelling).
+
+The counts are those of the following procedure, which repeatedly scans
+and copies the text:
+
+    for phrase in sorted(phrases, key=len, reverse=True):
+        counts[thesaurus.get(phrase, phrase)] += text.count(phrase)
+        text = text.replace(phrase, '|')  # Any character not in the phrases
+
+but all phrases are located in one pass over the text (see
+:obj:`term_matcher.TermMatcher.matches`), and are then assigned to the
+longest first. With :obj:`distinct=True`, each phrase is instead counted at
+most once per text, before the counts are summed under the canonical
+phrase, as in the original loop of the news topics notebook:
+
+    for phrase in sorted(phrases, key=len, reverse=True):
+        while phrase in text:
+            counts[thesaurus.get(phrase, phrase)] += 1
+            text = text.replace(phrase, '')
+
+(except that removing a phrase never joins the surrounding text into a new
+match). With :obj:`binary=True`, :obj:`count_matrix` records whether each
+canonical phrase occurs at all, i.e. its document frequency.
+'''
+
+from utils.term_matcher import TermMatcher
+from scipy.sparse import csr_matrix
+from collections import Counter
+
+
+class PhraseCounter:
+    '''Compiled counter of a list of phrases.
+
+    Args:
+        phrases (list): Phrases to count. Longer phrases take precedence over
+                        shorter phrases, and phrases of equal length take
+                        precedence in the order given.
+        thesaurus (dict): Mapping of phrase --> canonical phrase, under which
+                          the counts are reported.
+        lowercase (bool): Lowercase texts before counting.
+
+    Attributes:
+        vocabulary (list): Canonical phrases, in order of precedence, which
+                           are the columns of :obj:`count_matrix`.
+    '''
+    def __init__(self, phrases, thesaurus=None, lowercase=True):
+        self.phrases = sorted(dict.fromkeys(p for p in phrases if p != ''),
+                              key=len, reverse=True)
+        self.thesaurus = {} if thesaurus is None else thesaurus
+        self.lowercase = lowercase
+        self._rank = {phrase: rank for rank, phrase in enumerate(self.phrases)}
+        self.vocabulary = list(dict.fromkeys(self.thesaurus.get(p, p) for p in self.phrases))
+        word2idx = {phrase: idx for idx, phrase in enumerate(self.vocabulary)}
+        self._columns = [word2idx[self.thesaurus.get(p, p)] for p in self.phrases]
+        self._matcher = TermMatcher(self.phrases)
+
+    def _matches(self, text):
+        '''Every (rank, start, end) of every phrase in the text'''
+        return [(self._rank[phrase], start, end)
+                for phrase, start, end in self._matcher.matches(text)]
+
+    def _column_counts(self, text, distinct=False):
+        '''Mapping of column (canonical phrase index) --> count'''
+        if self.lowercase:
+            text = text.lower()
+        taken = bytearray(len(text))  # Characters already assigned to a phrase
+        counted = set()  # Ranks of the phrases already counted
+        counts = Counter()
+        for rank, start, end in sorted(self._matches(text)):
+            if any(taken[start:end]):
+                continue
+            taken[start:end] = b'\x01'*(end - start)
+            if distinct and rank in counted:
+                continue
+            counted.add(rank)
+            counts[self._columns[rank]] += 1
+        return counts
+
+    def count(self, text, distinct=False):
+        '''Count the phrases in the text.
+
+        Args:
+            text (str): The text to search.
+            distinct (bool): Count each phrase at most once, before summing
+                             the counts under the canonical phrase.
+        Returns:
+            counts (Counter): Mapping of canonical phrase --> count, for phrases
+                              which occur in the text.
+        '''
+        return Counter({self.vocabulary[idx]: count
+                        for idx, count in self._column_counts(text, distinct).items()})
+
+    def count_matrix(self, texts, binary=False, distinct=False):
+        '''Count the phrases in many texts, as a sparse matrix.
+
+        Args:
+            texts (iterable): Texts (str) to search.
+            binary (bool): Record whether each canonical phrase occurs, rather
+                           than its count.
+            distinct (bool): Count each phrase at most once per text, before
+                             summing the counts under the canonical phrase.
+        Returns:
+            counts (csr_matrix): Count of each canonical phrase (column, as
+                                 in :obj:`vocabulary`) in each text (row).
+        '''
+        indptr, indices, data = [0], [], []
+        for text in texts:
+            for idx, count in sorted(self._column_counts(text, distinct).items()):
+                indices.append(idx)
+                data.append(1 if binary else count)
+            indptr.append(len(indices))
+        return csr_matrix((data, indices, indptr), dtype=int,
+                          shape=(len(indptr) - 1, len(self.vocabulary)))
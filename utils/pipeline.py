@@ -0,0 +1,291 @@
+'''
+pipeline
+========
+
+Run the download -> filter -> tokenize -> expand -> export pipeline for
+several labels (i.e. date ranges and thresholds of the same query), as
+configured in a JSON file (e.g. utils/configs/nhs_digital_shift.json):
+
+    python -m utils.pipeline utils/configs/nhs_digital_shift.json --n-jobs 2
+
+The output of each stage is cached under data/processed/pipeline/, keyed by
+a hash of the parameters of the stage and the keys of the stages which it
+depends on, so stages whose inputs haven't changed are skipped. For example,
+changing a seed term only reruns the filter and export stages. The download
+stage only caches a reference to the raw articles (see :obj:`raw_store`),
+which are already saved by :obj:`news_api.download_articles`, and later
+stages depend on the version of the raw articles rather than the download key.
+Later stages read the raw articles from the memory-mapped article store
+data/raw/{label}.arrow (see :obj:`article_store`), e.g. only the searched
+columns are read for filtering. Missing outputs (data/processed/filtered_*.json
+and the exports) are rewritten even if the stage is cached.
+
+Config format (all but "core_terms" and "labels" are optional):
+
+    {"core_terms": [["nhs", "national health service"]],
+     "seed_terms": [[["video"], ["call", "consultation"]], ...],
+     "query": {"language": "en", "sort_by": "publishedAt", "page_size": 100},
+     "download": {"n_workers": 4, "rate_limit": 1, "adaptive": false},
+     "filter": {"min_core_df": 5, "min_seed_df": null, "n_jobs": 1},
+     "tokenize": {"field": "content"},
+     "expand": {"search_terms": "digital", "threshold": 0.3},
+     "export": {"formats": ["xlsx", "csv", "parquet"], "name": "my_output"},
+     "labels": {"nhs_since_june2019": {"start": "01 June, 2019",
+                                       "filter": {"min_core_df": 4, "min_seed_df": 2}},
+                "nhs_since_march_2": {}}}
+
+The "query" defaults to an OR of the core terms. Each label can override
+"start", "until" and the settings of any stage. Stages which are not
+configured (tokenize, expand and export) are not run. Exports are saved
+under data/outputs/ with the "name" of the export (default=the label).
+'''
+
+from utils.datapath import datapath
+from utils.news_api import download_articles
+from utils.article_store import load_store
+from utils.keyword_filter import filter_articles, TermSet
+from utils.export import ranked_rows, write_xlsx, write_csv, write_parquet
+from utils import metrics
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+import argparse
+import hashlib
+import pickle
+import json
+import os
+
+STAGES = ['download', 'filter', 'tokenize', 'expand', 'export']
+EXECUTION_PARAMS = {'n_workers', 'rate_limit', 'max_retries', 'n_jobs', 'batch_size',
+                    'cache', 'verbose'}  # Don't affect the output of a stage
+WRITERS = dict(xlsx=write_xlsx, csv=write_csv, parquet=write_parquet)
+
+
+def stage_key(stage, params, *upstream_keys):
+    '''Hash of the parameters of a stage (other than :obj:`EXECUTION_PARAMS`)
+    and the keys of its upstream stages'''
+    params = {k: v for k, v in params.items() if k not in EXECUTION_PARAMS}
+    payload = json.dumps([stage, params, upstream_keys], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+
+def raw_store(label):
+    '''Reference to the raw articles of a label, as saved by
+    :obj:`news_api.download_articles`.
+
+    Returns:
+        reference (dict): The filename of the articles, and their version, i.e. a
+                          hash of the manifest of downloaded chunks (or, if the
+                          articles predate the chunk cache, the file's size and
+                          modification time), or None if the file is missing.
+    '''
+    filename = datapath('raw', f'{label}.json')
+    manifest = os.path.join(datapath('raw', label), 'manifest.json')
+    if not os.path.isfile(filename):
+        version = None
+    elif os.path.isfile(manifest):
+        with open(manifest, 'rb') as f:
+            version = hashlib.sha1(f.read()).hexdigest()[:16]
+    else:
+        stat = os.stat(filename)
+        version = f'{stat.st_size}-{stat.st_mtime_ns}'
+    return dict(filename=filename, version=version)
+
+
+def _cached(stage, key, run, force=False, report=None):
+    '''Load the output of a stage from the cache, or run it and cache the output.
+
+    Args:
+        stage (str): Name of the stage.
+        key (str): Key of the stage, from :obj:`stage_key`.
+        run (function): Run the stage, returning a picklable output.
+        force (bool): Rerun the stage even if it has been cached.
+        report (dict): If provided, record whether the stage was skipped.
+    Returns:
+        output: The output of :obj:`run`.
+    '''
+    cache_dir = datapath('processed', 'pipeline')
+    os.makedirs(cache_dir, exist_ok=True)
+    filename = os.path.join(cache_dir, f'{stage}-{key}.pkl')
+    skipped = os.path.isfile(filename) and not force
+    if skipped:
+        with open(filename, 'rb') as f:
+            output = pickle.load(f)
+        metrics.count('pipeline.skipped', stage=stage)
+    else:
+        output = run()
+        with open(f'{filename}.tmp', 'wb') as f:
+            pickle.dump(output, f)
+        os.replace(f'{filename}.tmp', filename)
+    if report is not None:
+        report[stage] = dict(key=key, skipped=skipped)
+    return output
+
+
+def label_config(config, label):
+    '''Settings of each stage for a label, with the label's overrides applied.
+
+    Args:
+        config (dict): Pipeline config (see the module docstring).
+        label (str): One of the labels in the config.
+    Returns:
+        settings (dict): Mapping of stage --> settings, for each configured stage.
+    '''
+    overrides = config['labels'][label] or {}
+    core_terms = config['core_terms']
+    query = dict(q=' OR '.join(f'("{term}")' for term in core_terms[0]))
+    query.update(config.get('query', {}))
+    settings = dict(download=dict(query=query, start=overrides.get('start', 'March 01, 2020'),
+                                  until=overrides.get('until') or date.today().isoformat()),
+                    filter=dict(core_terms=core_terms,
+                                seed_terms=config.get('seed_terms', [])))
+    for stage in STAGES:
+        if stage in config or stage in overrides or stage in settings:
+            settings.setdefault(stage, {})
+            settings[stage].update(config.get(stage, {}))
+            settings[stage].update(overrides.get(stage, {}))
+    return settings
+
+
+def run_label(config, label, force=()):
+    '''Run the pipeline for a single label.
+
+    Args:
+        config (dict): Pipeline config (see the module docstring).
+        label (str): One of the labels in the config.
+        force (list): Stages to rerun even if they have been cached.
+    Returns:
+        report (dict): Mapping of stage --> dict of the stage key and whether
+                       the stage was skipped.
+    '''
+    settings = label_config(config, label)
+    report = {}
+
+    # Download, caching only a reference to the raw articles
+    download_params = dict(settings['download'])
+    query = download_params.pop('query')
+    download_key = stage_key('download', dict(label=label, **settings['download']))
+    stores = []
+
+    def _download():
+        download_articles(label, **download_params, **query)
+        return raw_store(label)
+    raw = _cached('download', download_key, _download,
+                  force='download' in force, report=report)
+    if raw != raw_store(label):  # The raw articles have changed since
+        raw = _cached('download', download_key, _download, force=True, report=report)
+
+    def open_store():
+        if not stores:
+            stores.append(load_store(label))
+        return stores[0]
+
+    # Filter, reading only the columns which are searched
+    filter_params = dict(settings['filter'])
+    filter_key = stage_key('filter', filter_params, raw['version'])
+    filtered_filename = datapath('processed', f'filtered_{label}.json')
+
+    def _filter():
+        core_terms = TermSet.from_core_terms(filter_params.pop('core_terms'))
+        seed_terms = TermSet.from_seed_terms(filter_params.pop('seed_terms'))
+        articles = open_store().articles(columns=['title', 'content', 'description'])
+        ranked_articles = filter_articles(articles, core_terms, seed_terms,
+                                          **filter_params)
+        with open(filtered_filename, 'w') as f:
+            f.write(json.dumps(ranked_articles))
+        return ranked_articles
+    ranked_articles = _cached('filter', filter_key, _filter,
+                              force='filter' in force or not os.path.isfile(filtered_filename),
+                              report=report)
+
+    # Tokenize and expand
+    if 'tokenize' in settings:
+        tokenize_params = dict(settings['tokenize'])
+        tokenize_key = stage_key('tokenize', tokenize_params, raw['version'])
+        field = tokenize_params.pop('field', 'content')
+
+        def _tokenize():
+            from utils.tokenizer import tokenize  # Requires NLTK and spaCy
+            return tokenize(list(open_store().articles()), field, **tokenize_params)
+        docs = _cached('tokenize', tokenize_key, _tokenize,
+                       force='tokenize' in force, report=report)
+    if 'expand' in settings:
+        if 'tokenize' not in settings:
+            raise ValueError('The expand stage requires the tokenize stage')
+        expand_params = dict(settings['expand'])
+        expand_key = stage_key('expand', expand_params, tokenize_key)
+
+        def _expand():
+            from utils.keyword_expansion import keyword_expansion
+            keywords, unkeywords = keyword_expansion(docs, **expand_params)
+            keywords = {term: float(score) for term, score in keywords.items()}
+            unkeywords = {term: float(score) for term, score in unkeywords.items()}
+            with open(datapath('processed', f'keywords_{label}.json'), 'w') as f:
+                f.write(json.dumps(dict(keywords=keywords, unkeywords=unkeywords)))
+            return keywords, unkeywords
+        _cached('expand', expand_key, _expand, force='expand' in force, report=report)
+
+    # Export
+    if 'export' in settings:
+        export_params = dict(settings['export'])
+        export_key = stage_key('export', export_params, raw['version'], filter_key)
+        name = export_params.pop('name', label)
+        filenames = {_format: datapath('outputs', f'{name}.{_format}')
+                     for _format in export_params.pop('formats', ['xlsx'])}
+
+        def _export():
+            for _format, filename in filenames.items():
+                WRITERS[_format](ranked_rows(ranked_articles, open_store()), filename,
+                                 **export_params)
+            return list(filenames.values())
+        missing = not all(os.path.isfile(filename) for filename in filenames.values())
+        _cached('export', export_key, _export, force='export' in force or missing,
+                report=report)
+    return report
+
+
+def run(config, labels=None, n_jobs=1, force=()):
+    '''Run the pipeline for several labels, in parallel threads.
+
+    Args:
+        config (dict): Pipeline config (see the module docstring).
+        labels (list): Labels to run. Default=all labels in the config.
+        n_jobs (int): Number of labels to run at once.
+        force (list): Stages to rerun even if they have been cached.
+    Returns:
+        reports (dict): Mapping of label --> report from :obj:`run_label`.
+    '''
+    if labels is None:
+        labels = list(config['labels'])
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        reports = executor.map(lambda label: run_label(config, label, force=force), labels)
+        return dict(zip(labels, reports))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Run the news article pipeline.')
+    parser.add_argument('config', help='Path to the JSON config file')
+    parser.add_argument('--labels', nargs='+', help='Labels to run (default=all)')
+    parser.add_argument('--n-jobs', type=int, default=1,
+                        help='Number of labels to run at once')
+    parser.add_argument('--force', nargs='+', default=[], choices=STAGES,
+                        help='Stages to rerun even if they have been cached')
+    parser.add_argument('--metrics', action='store_true',
+                        help='Write timings and counts as JSON lines to stderr')
+    args = parser.parse_args(args)
+    with open(args.config) as f:
+        config = json.load(f)
+    if args.metrics:
+        metrics.enable(metrics.json_hook())
+    try:
+        reports = run(config, labels=args.labels, n_jobs=args.n_jobs, force=args.force)
+    finally:
+        metrics.disable()
+    for label, report in reports.items():
+        stages = ', '.join(f'{stage} ({"cached" if info["skipped"] else "ran"})'
+                           for stage, info in report.items())
+        print(f'{label}: {stages}')
+    return reports
+
+
+if __name__ == '__main__':
+    main()
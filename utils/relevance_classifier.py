@@ -0,0 +1,156 @@
+'''
+relevance_classifier
+====================
+
+Train a classifier of relevant (signal) vs irrelevant (background) articles
+from tokenized documents, as in the data-driven filtering notebook: TF-IDF
+features followed by a random forest.
+
+The grid search over the TF-IDF settings (min_df, max_df and the n-gram
+range) counts n-grams once, at the largest n-gram range, and derives the
+features of each setting by masking columns, which gives exactly the
+features of a TfidfVectorizer fitted with that setting. The models are then
+fitted and scored in parallel with joblib.
+'''
+
+from utils.keyword_expansion import _feature_names
+from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.pipeline import make_pipeline
+from joblib import Parallel, delayed
+import joblib
+import numpy as np
+import itertools
+import numbers
+
+
+def _join(docs):
+    '''Tokenized documents as space-delimited text'''
+    return [' '.join(doc) for doc in docs]
+
+
+def _df_mask(df, n_docs, min_df, max_df):
+    '''Columns kept by the min_df and max_df of a CountVectorizer'''
+    min_count = min_df if isinstance(min_df, numbers.Integral) else min_df*n_docs
+    max_count = max_df if isinstance(max_df, numbers.Integral) else max_df*n_docs
+    return (df >= min_count) & (df <= max_count)
+
+
+class CountCache:
+    '''N-gram counts of the training and validation documents, from which the
+    TF-IDF features for any min_df, max_df and n-gram range (up to
+    :obj:`ngram_max`) are derived without recounting.
+
+    Args:
+        train_docs (list): Tokenized training documents (each doc is a list).
+        valid_docs (list): Tokenized validation documents.
+        ngram_max (int): Largest n-gram order.
+    '''
+    def __init__(self, train_docs, valid_docs, ngram_max):
+        vectorizer = CountVectorizer(ngram_range=(1, ngram_max))
+        self.train_counts = vectorizer.fit_transform(_join(train_docs)).tocsc()
+        self.valid_counts = vectorizer.transform(_join(valid_docs)).tocsc()
+        features = _feature_names(vectorizer)
+        self.orders = np.array([feature.count(' ') + 1 for feature in features])
+        self.df = np.diff(self.train_counts.indptr)  # Number of docs containing each n-gram
+
+    def features(self, min_df=1, max_df=1.0, ngram_max=1):
+        '''TF-IDF features, as from TfidfVectorizer(min_df=min_df, max_df=max_df,
+        ngram_range=(1, ngram_max)) fitted to the training documents.
+
+        Returns:
+            X (csr_matrix): Features of the training documents.
+            X0 (csr_matrix): Features of the validation documents.
+        '''
+        n_docs = self.train_counts.shape[0]
+        mask = (self.orders <= ngram_max) & _df_mask(self.df, n_docs, min_df, max_df)
+        if not mask.any():
+            raise ValueError(f'No features remain for min_df={min_df}, '
+                             f'max_df={max_df}, ngram_max={ngram_max}')
+        columns = np.flatnonzero(mask)
+        transformer = TfidfTransformer().fit(self.train_counts[:, columns])
+        return (transformer.transform(self.train_counts[:, columns]).tocsr(),
+                transformer.transform(self.valid_counts[:, columns]).tocsr())
+
+
+def _fit_score(X, y, X0, y0, random_state, **model_params):
+    clf = RandomForestClassifier(random_state=random_state, **model_params)
+    clf.fit(X, y)
+    return clf.score(X0, y0)
+
+
+def grid_search(signal, background, valid_signal, valid_background,
+                min_dfs=(1,), max_dfs=(1.0,), ngram_maxes=(1,),
+                n_estimators=(100,), max_depths=(None,), min_samples_splits=(2,),
+                n_jobs=1, random_state=0):
+    '''Score every combination of TF-IDF and random forest settings on the
+    validation documents.
+
+    Args:
+        signal, background (list): Tokenized training documents of each class.
+        valid_signal, valid_background (list): Tokenized validation documents.
+        min_dfs, max_dfs, ngram_maxes (iterable): TF-IDF settings, where the
+                                                  n-gram range is (1, ngram_max).
+        n_estimators, max_depths, min_samples_splits (iterable): Random forest settings.
+        n_jobs (int): Number of models to fit at once (joblib), for each TF-IDF setting.
+        random_state (int): Random state of every random forest.
+    Returns:
+        results (list): One dict per combination, containing the settings and
+                        the validation "score" (accuracy), from best to worst.
+    '''
+    y = [1]*len(signal) + [0]*len(background)
+    y0 = [1]*len(valid_signal) + [0]*len(valid_background)
+    ngram_maxes = list(ngram_maxes)
+    counts = CountCache(signal + background, valid_signal + valid_background,
+                        max(ngram_maxes))
+    models = [dict(n_estimators=int(_n_estimators), max_depth=_max_depth,
+                   min_samples_split=_min_samples_split)
+              for _n_estimators, _max_depth, _min_samples_split
+              in itertools.product(n_estimators, max_depths, min_samples_splits)]
+    results = []
+    # Only the features of one setting at a time are held in memory
+    with Parallel(n_jobs=n_jobs) as parallel:
+        for min_df, max_df, ngram_max in itertools.product(min_dfs, max_dfs, ngram_maxes):
+            X, X0 = counts.features(min_df=min_df, max_df=max_df, ngram_max=ngram_max)
+            scores = parallel(delayed(_fit_score)(X, y, X0, y0, random_state, **model)
+                              for model in models)
+            results += [dict(score=score, min_df=min_df, max_df=max_df,
+                             ngram_max=ngram_max, **model)
+                        for score, model in zip(scores, models)]
+    return sorted(results, key=lambda result: result['score'], reverse=True)
+
+
+def train_classifier(signal, background, min_df=1, max_df=1.0, ngram_max=1,
+                     random_state=0, **model_params):
+    '''Fit the vectorizer and classifier, e.g. with the best settings from
+    :obj:`grid_search`.
+
+    Args:
+        signal, background (list): Tokenized training documents of each class.
+        min_df, max_df, ngram_max: TF-IDF settings.
+        random_state (int): Random state of the random forest.
+        model_params: Other settings of the random forest.
+    Returns:
+        classifier (Pipeline): Fitted vectorizer and classifier, which take
+                               space-delimited text (see :obj:`score_docs`).
+    '''
+    classifier = make_pipeline(TfidfVectorizer(min_df=min_df, max_df=max_df,
+                                               ngram_range=(1, ngram_max)),
+                               RandomForestClassifier(random_state=random_state,
+                                                      **model_params))
+    return classifier.fit(_join(signal + background),
+                          [1]*len(signal) + [0]*len(background))
+
+
+def score_docs(classifier, docs):
+    '''Probability that each tokenized document is relevant'''
+    return classifier.predict_proba(_join(docs))[:, 1]
+
+
+def save_classifier(classifier, filename):
+    joblib.dump(classifier, filename)
+
+
+def load_classifier(filename):
+    return joblib.load(filename)
@@ -0,0 +1,119 @@
+"""
+term_matcher
+============
+
+Count occurrences of many terms in a single pass over a text.
+
+The counts are identical to calling :obj:`str.count` once per term
+(i.e. non-overlapping occurrences of each term, scanning left to right),
+but the text is only scanned once, regardless of the number of terms.
+"""
+
+import re
+
+_END = None  # Trie key marking the end of a term
+
+
+def _build_trie(terms):
+    '''Build a character trie of the terms, as nested dicts.'''
+    trie = {}
+    for term in terms:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        node[_END] = term
+    return trie
+
+
+def _trie_regex(node):
+    '''Generate a regex pattern from a trie, so that alternatives which
+    share a prefix are only tested once by the regex engine.'''
+    alternatives = []
+    for char, child in sorted((k, v) for k, v in node.items() if k is not _END):
+        alternatives.append(re.escape(char) + _trie_regex(child))
+    if not alternatives:
+        return ''
+    if _END in node:
+        alternatives.append('')
+    if len(alternatives) == 1:
+        return alternatives[0]
+    return '(?:' + '|'.join(alternatives) + ')'
+
+
+class TermMatcher:
+    '''Compiled matcher for counting a list of terms in one pass of a text.
+
+    A regex built from a trie of the terms locates every position at which
+    any term starts, and the trie is then walked from each of these positions
+    to find all terms starting there. Terms may be repeated in :obj:`terms`,
+    in which case each repeat is counted (as would be the case when
+    summing :obj:`str.count` over the list of terms).
+
+    Args:
+        terms (list): List of terms (str) to count.
+    '''
+    def __init__(self, terms):
+        self.terms = list(terms)
+        unique_terms = set(term for term in self.terms if term != '')
+        self._count_empty = '' in self.terms
+        self._trie = _build_trie(unique_terms)
+        pattern = _trie_regex(self._trie)
+        self._regex = re.compile(f'(?={pattern})') if pattern else None
+
+    def matches(self, text):
+        '''Locate every occurrence of every (unique, non-empty) term in the
+        text, including occurrences which overlap, in order of their start.
+
+        Args:
+            text (str): The text to search.
+        Yields:
+            term, start, end: Each term found, and its position in the text.
+        '''
+        if self._regex is None:
+            return
+        n = len(text)
+        for match in self._regex.finditer(text):
+            start = pos = match.start()
+            node = self._trie
+            while node is not None:
+                term = node.get(_END)
+                if term is not None:
+                    yield term, start, pos
+                if pos == n:
+                    break
+                node = node.get(text[pos])
+                pos += 1
+
+    def _unique_counts(self, text):
+        '''Count each unique term in the text.'''
+        counts = {}
+        last_end = {}  # End position of the last counted match of each term
+        if self._count_empty:
+            counts[''] = len(text) + 1  # As per ''.count('')
+        for term, start, end in self.matches(text):
+            if start >= last_end.get(term, 0):
+                counts[term] = counts.get(term, 0) + 1
+                last_end[term] = end
+        return counts
+
+    def count(self, text):
+        '''Count every term in the text.
+
+        Args:
+            text (str): The text to search.
+        Returns:
+            counts (list): Number of occurrences of each term in :obj:`terms`.
+        '''
+        counts = self._unique_counts(text)
+        return [counts.get(term, 0) for term in self.terms]
+
+    def total(self, text):
+        '''Sum of the number of occurrences of all terms in the text, equivalent
+        to :obj:`sum(text.count(term) for term in terms)`.
+
+        Args:
+            text (str): The text to search.
+        Returns:
+            total (int): Total number of occurrences.
+        '''
+        return sum(self.count(text))
@@ -0,0 +1,19 @@
+import os
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'stable: deterministic, CPU-bound benchmark, '
+                                       'which is compared against the baseline')
+
+
+def pytest_collection_modifyitems(config, items):
+    '''Leave the benchmarks out of the test run, unless run with --benchmark-only'''
+    if config.getoption('benchmark_only', default=False):
+        return
+    benchmarks = [item for item in items
+                  if os.path.dirname(str(item.fspath)) == BENCHMARK_DIR]
+    if benchmarks:
+        config.hook.pytest_deselected(items=benchmarks)
+        items[:] = [item for item in items if item not in benchmarks]
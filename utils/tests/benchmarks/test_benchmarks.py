@@ -0,0 +1,129 @@
+'''
+Benchmarks of the collect -> filter -> tokenize -> expand pipeline on a
+synthetic corpus (see :obj:`synthetic`), with collection from a local
+:obj:`FakeNewsAPI` which waits LATENCY seconds before each response. Scale
+up the corpus with the environment variable BENCHMARK_SCALE (default=1).
+
+The benchmarks are left out of the test run (see conftest.py), and are run with:
+
+    python -m pytest utils/tests/benchmarks --benchmark-only
+
+Only the deterministic, CPU-bound benchmarks (marked "stable") are compared
+against the baseline, since collection times depend on the network and
+thread scheduling. Their fastest rounds still vary by up to ~50% between
+runs on a small shared VM, so the gate fails on a doubling of the fastest
+round, which catches algorithmic regressions rather than noise. Save a
+baseline, and fail on regressions against it (on the same machine):
+
+    python -m pytest utils/tests/benchmarks --benchmark-only -m stable --benchmark-min-rounds=20 --benchmark-storage=utils/tests/benchmarks/baselines --benchmark-save=baseline
+    python -m pytest utils/tests/benchmarks --benchmark-only -m stable --benchmark-min-rounds=20 --benchmark-storage=utils/tests/benchmarks/baselines --benchmark-compare --benchmark-compare-fail=min:100%
+'''
+
+import pytest
+pytest.importorskip('pytest_benchmark')
+
+from newsapi import const
+from itertools import count
+import os
+
+from utils import news_api
+from utils.news_api import download_articles
+from utils.news_api import get_articles
+from utils.keyword_filter import filter_articles
+from utils.keyword_filter import TermSet
+from utils.keyword_expansion import keyword_expansion
+from utils.keyword_expansion import ExpansionEngine
+from utils.tests.fake_newsapi import FakeNewsAPI
+from utils.tests.synthetic import articles_for_day
+from utils.tests.synthetic import synthetic_articles
+from utils.tests.synthetic import CORE_TERMS
+
+SCALE = int(os.environ.get('BENCHMARK_SCALE', 1))
+LATENCY = 0.02  # Seconds per request
+N_ARTICLES = 2000*SCALE
+QUERY = dict(q='nhs', language='en', sort_by='publishedAt', page_size=100)
+CORE = [CORE_TERMS]
+SEED = [[['video'], ['call', 'consultation']], [['remote monitoring']],
+        [['digital'], ['health', 'transformation']], [['telehealth', 'online triage']],
+        [['patient data']], [['health tech']], [['electronic'], ['prescribing']]]
+
+
+@pytest.fixture(scope='module')
+def articles():
+    return synthetic_articles(N_ARTICLES)
+
+
+@pytest.fixture(scope='module')
+def docs(articles):
+    return [(art['title'] + ' ' + art['description']).lower().split()
+            for art in articles]
+
+
+@pytest.fixture
+def newsapi(tmp_path, monkeypatch):
+    monkeypatch.setattr(news_api, 'news_api_key', lambda: 'test-key')
+    monkeypatch.setattr(news_api, 'datapath',
+                        lambda data_dirname, filename: str(tmp_path / filename))
+    fake = FakeNewsAPI(articles_for_day=articles_for_day(per_day=50*SCALE),
+                       latency=LATENCY)
+    monkeypatch.setattr(const, 'EVERYTHING_URL', fake.url)
+    with fake:
+        yield fake
+
+
+def test_get_articles(benchmark, newsapi):
+    articles = benchmark(lambda: list(get_articles(from_param='2020-03-01',
+                                                   to='2020-03-07', **QUERY)))
+    assert len(articles) == 7*50*SCALE
+
+
+@pytest.mark.parametrize('n_workers', [1, 4])
+def test_download_articles(benchmark, newsapi, n_workers):
+    labels = count()
+
+    def setup():
+        return (f'bench_{next(labels)}',), {}
+
+    def download(label):  # A new label for each round, so nothing is cached
+        return download_articles(label, start='1 March, 2020', until='29 March, 2020',
+                                 n_workers=n_workers, **QUERY)
+
+    articles = benchmark.pedantic(download, setup=setup, rounds=3)
+    assert 0 < len(articles) <= 28*50*SCALE  # Syndicated titles are deduplicated
+
+
+@pytest.mark.stable
+def test_filter_articles(benchmark, articles):
+    ranked = benchmark(filter_articles, articles, CORE, SEED, min_core_df=1, min_seed_df=1)
+    assert len(ranked) > 0
+
+
+@pytest.mark.stable
+def test_filter_articles_term_set(benchmark, articles):
+    term_sets = TermSet.from_core_terms(CORE), TermSet.from_seed_terms(SEED)
+    ranked = benchmark(filter_articles, articles, *term_sets, min_core_df=1, min_seed_df=1)
+    assert len(ranked) > 0
+
+
+@pytest.mark.stable
+def test_tokenize(benchmark, articles):
+    pytest.importorskip('spacy')
+    try:
+        from utils.tokenizer import tokenize
+    except LookupError:  # The NLTK stopwords corpus is required by utils.tokenizer
+        pytest.skip('NLTK stopwords corpus not available')
+    docs = benchmark(tokenize, articles[:200*SCALE], 'description')
+    assert len(docs) > 0
+
+
+@pytest.mark.stable
+def test_keyword_expansion(benchmark, docs):
+    keywords, _ = benchmark(keyword_expansion, docs, 'nhs')
+    assert 'nhs' in keywords
+
+
+@pytest.mark.stable
+def test_expansion_engine_query(benchmark, docs):
+    engine = ExpansionEngine(docs)
+    keywords, _ = benchmark(engine.query, 'nhs')
+    assert 'nhs' in keywords
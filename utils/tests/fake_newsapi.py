@@ -0,0 +1,119 @@
+'''
+fake_newsapi
+============
+
+A local HTTP server imitating the NewsAPI /v2/everything endpoint, for testing
+the collection code without an API key or network access.
+'''
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from datetime import datetime, timedelta
+import threading
+import time
+import json
+
+DEVELOPER_LIMIT_MESSAGE = ('You have requested too many results. Developer accounts '
+                           'are limited to a max of 100 results.')
+
+
+def parse_date(datestring, end_of_day=False):
+    '''Parse dates in NewsAPI format, with or without a time'''
+    if len(datestring) == 10:
+        date = datetime.strptime(datestring, '%Y-%m-%d')
+        return date.replace(hour=23, minute=59, second=59) if end_of_day else date
+    return datetime.strptime(datestring.rstrip('Z'), '%Y-%m-%dT%H:%M:%S')
+
+
+def default_articles(day):
+    '''Generate three articles per day, one of which is syndicated every day'''
+    date = day.strftime('%Y-%m-%d')
+    return [dict(source=dict(id=None, name=f'Source {i}'), author=None,
+                 title=f'Article {i} on {date}', description=f'Description {i}',
+                 url=f'https://news.example/{date}/{i}',
+                 urlToImage=None, publishedAt=f'{date}T12:00:00Z',
+                 content=f'The NHS on {date} said {i}')
+            for i in range(2)] + [dict(source=dict(id=None, name='Wire'), author=None,
+                                       title='Syndicated story', description=None,
+                                       url=f'https://wire.example/{date}',
+                                       urlToImage=None,
+                                       publishedAt=f'{date}T09:00:00Z',
+                                       content=None)]
+
+
+class FakeNewsAPI:
+    '''Serve articles between the "from" and "to" dates (inclusive)
+    of each request, with pagination.
+
+    Args:
+        articles_for_day (function): Generate the articles published on a given
+                                     :obj:`datetime`, in the NewsAPI schema.
+        max_results (int): Respond as for a developer account beyond this many results.
+        n_failures (int): Respond with a transient "rateLimited" error to this many
+                          of the first requests.
+        latency (float): Seconds to wait before each response, as for a remote
+                         server. Requests are served concurrently, so waits overlap.
+    '''
+    def __init__(self, articles_for_day=default_articles, max_results=None,
+                 n_failures=0, latency=0):
+        self.articles_for_day = articles_for_day
+        self.max_results = max_results
+        self.n_failures = n_failures
+        self.latency = latency
+        self.requests = []
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.url = f'http://127.0.0.1:{self.server.server_port}/v2/everything'
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                params = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+                time.sleep(fake.latency)
+                status, body = fake.respond(params)
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+        return Handler
+
+    def articles(self, from_param, to):
+        '''All articles between two dates (inclusive), most recent first'''
+        from_param, to = parse_date(from_param), parse_date(to, end_of_day=True)
+        day = from_param.replace(hour=0, minute=0, second=0)
+        articles = []
+        while day <= to:
+            articles = [art for art in self.articles_for_day(day)
+                        if from_param <= parse_date(art['publishedAt']) <= to] + articles
+            day += timedelta(days=1)
+        return articles
+
+    def respond(self, params):
+        with self.lock:
+            self.requests.append(params)
+            if self.n_failures > 0:
+                self.n_failures -= 1
+                return 429, dict(status='error', code='rateLimited',
+                                 message='Too many requests')
+        page, page_size = int(params.get('page', 1)), int(params.get('pageSize', 20))
+        if self.max_results is not None and (page - 1)*page_size >= self.max_results:
+            return 426, dict(status='error', code='maximumResultsReached',
+                             message=DEVELOPER_LIMIT_MESSAGE)
+        articles = self.articles(params['from'], params['to'])
+        return 200, dict(status='ok', totalResults=len(articles),
+                         articles=articles[(page - 1)*page_size:page*page_size])
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
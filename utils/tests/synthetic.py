@@ -0,0 +1,111 @@
+'''
+synthetic
+=========
+
+Generate synthetic NewsAPI articles at any scale, for benchmarking. Articles
+follow the NewsAPI schema (including the " - Source" title suffix and
+"[+N chars]" truncation of the content), and a configurable fraction
+mention the core and seed terms or are syndicated copies of another article.
+Generation is deterministic for a given seed.
+'''
+
+from datetime import datetime, timedelta
+import random
+
+CORE_TERMS = ['nhs', 'national health service']
+SEED_TERMS = ['video call', 'video consultation', 'remote monitoring',
+              'digital health', 'telehealth', 'online triage', 'patient data',
+              'health tech', 'digital transformation', 'electronic prescribing']
+WORDS = ['the', 'a', 'government', 'said', 'on', 'today', 'hospital', 'patients',
+         'staff', 'new', 'plans', 'for', 'care', 'services', 'in', 'with', 'after',
+         'doctors', 'council', 'report', 'local', 'week', 'people', 'would', 'has',
+         'been', 'pandemic', 'lockdown', 'minister', 'funding', 'data', 'system',
+         'community', 'support', 'access', 'million', 'year', 'public', 'of', 'to']
+SOURCES = ['BBC News', 'The Guardian', 'Reuters', 'Sky News', 'The Independent',
+           'Daily Mail', 'Financial Times', 'The Telegraph']
+
+
+def _sentence(rng, n_words, core_rate, seed_rate):
+    words = rng.choices(WORDS, k=n_words)
+    if rng.random() < core_rate:
+        words.insert(rng.randrange(len(words) + 1), rng.choice(CORE_TERMS))
+    if rng.random() < seed_rate:
+        words.insert(rng.randrange(len(words) + 1), rng.choice(SEED_TERMS))
+    return ' '.join(words)
+
+
+def synthetic_article(rng, published, n_words=60, core_rate=0.5, seed_rate=0.2):
+    '''Generate a single article.
+
+    Args:
+        rng (random.Random): Source of randomness.
+        published (datetime): Publication time of the article.
+        n_words (int): Approximate number of words in the full content.
+        core_rate (float): Probability that each sentence mentions a core term.
+        seed_rate (float): Probability that each sentence mentions a seed term.
+    Returns:
+        article (dict): Article in the NewsAPI format.
+    '''
+    source = rng.choice(SOURCES)
+    title = _sentence(rng, 8, core_rate, seed_rate).capitalize()
+    sentences = [_sentence(rng, 12, core_rate, seed_rate)
+                 for _ in range(max(1, n_words // 12))]
+    content = '. '.join(sentences)
+    truncated = f'{content[:200]}… [+{max(0, len(content) - 200)} chars]'
+    slug = '-'.join(title.lower().split()[:6])
+    return dict(source=dict(id=None, name=source), author=rng.choice([None, 'Staff']),
+                title=f'{title} - {source}', description=sentences[0],
+                url=f'https://news.example/{published:%Y/%m/%d}/{slug}-{rng.randrange(10**6)}',
+                urlToImage=None, publishedAt=published.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                content=truncated)
+
+
+def articles_for_day(per_day=100, seed=0, syndicated_rate=0.1, **kwargs):
+    '''Generator of each day's articles, e.g. for :obj:`FakeNewsAPI`.
+
+    Args:
+        per_day (int): Number of articles per day.
+        seed (int): Seed, combined with the date so that each day is reproducible.
+        syndicated_rate (float): Fraction of articles which are copies of
+                                 another article on the same day, from a different source.
+        kwargs: Keyword arguments for :obj:`synthetic_article`.
+    Returns:
+        articles_for_day (function): Articles (list) published on a given :obj:`datetime`,
+                                     most recent first.
+    '''
+    def _articles_for_day(day):
+        rng = random.Random(seed*100000 + day.toordinal())
+        day = datetime(day.year, day.month, day.day)
+        seconds = sorted(rng.sample(range(86400), per_day), reverse=True)
+        articles = []
+        for second in seconds:
+            published = day + timedelta(seconds=second)
+            if articles and rng.random() < syndicated_rate:
+                article = dict(rng.choice(articles))
+                article.update(source=dict(id=None, name=rng.choice(SOURCES)),
+                               publishedAt=published.strftime('%Y-%m-%dT%H:%M:%SZ'))
+            else:
+                article = synthetic_article(rng, published, **kwargs)
+            articles.append(article)
+        return articles
+    return _articles_for_day
+
+
+def synthetic_articles(n_articles, start='2020-03-01', per_day=100, seed=0, **kwargs):
+    '''Generate a corpus of articles, in the order returned by NewsAPI
+    (most recent first) over as many days as required.
+
+    Args:
+        n_articles (int): Number of articles.
+        start (str): First day of the corpus (YYYY-MM-DD).
+        per_day, seed, kwargs: See :obj:`articles_for_day`.
+    Returns:
+        articles (list)
+    '''
+    generate = articles_for_day(per_day=per_day, seed=seed, **kwargs)
+    day = datetime.strptime(start, '%Y-%m-%d')
+    articles = []
+    while len(articles) < n_articles:
+        articles = generate(day)[:n_articles - len(articles)] + articles
+        day += timedelta(days=1)
+    return articles
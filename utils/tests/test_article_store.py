@@ -0,0 +1,40 @@
+from utils.article_store import ArticleStore
+from utils.article_store import write_store
+
+import pytest
+
+
+@pytest.fixture
+def articles():
+    return [dict(source=dict(id=None, name=f'Source {i}'), author=None,
+                 title=f'Title {i % 3}', description=None,
+                 url=f'https://news.example/{i}', urlToImage=None,
+                 publishedAt='2020-03-01T12:00:00Z', content=f'Content {i}')
+            for i in range(5)]
+
+
+@pytest.fixture
+def store(articles, tmp_path):
+    filename = str(tmp_path / 'articles.arrow')
+    write_store(iter(articles), filename, batch_size=2)
+    return ArticleStore(filename)
+
+
+def test_random_access(store, articles):
+    assert len(store) == len(articles)
+    assert [store[i] for i in range(len(store))] == articles
+    assert store[-1] == articles[-1]
+    with pytest.raises(IndexError):
+        store[len(articles)]
+
+
+def test_columns(store, articles):
+    assert store.column('content') == [art['content'] for art in articles]
+    assert list(store.articles(columns=['title', 'content'])) == \
+        [dict(title=art['title'], content=art['content']) for art in articles]
+
+
+def test_find(store):
+    assert store.find(title='Title 1') == 1
+    assert store.find(url='https://news.example/4') == 4
+    assert store.find(title='Title 4') is None
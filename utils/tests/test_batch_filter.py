@@ -0,0 +1,37 @@
+from utils.batch_filter import ArticleTermMatrix
+from utils.batch_filter import sweep
+from utils.keyword_filter import filter_articles
+
+import pytest
+
+
+@pytest.fixture
+def articles():
+    return [dict(title='a', content='NHS video calls and video chats for the nhs',
+                 description=None),
+            dict(title='a', content='nhs nhs video call', description=None),
+            dict(title='b', content=None, description='nhs video call'),
+            dict(title='c', content=None, description=None),
+            dict(title='d', content='nhs nhs remote monitoring', description=None)]
+
+
+@pytest.fixture
+def configs():
+    return [dict(core_terms=[['nhs']], seed_terms=[[['video'], ['call', 'chat']]],
+                 min_core_df=1),
+            dict(core_terms=[['nhs']], seed_terms=[[['remote monitoring']]],
+                 min_core_df=2, min_seed_df=1),
+            dict(core_terms=[['nhs', 'nhs']], seed_terms=[[['video call']]],
+                 min_core_df=3)]
+
+
+def test_sweep_matches_filter_articles(articles, configs):
+    expected = [filter_articles(articles, **config) for config in configs]
+    assert sweep(articles, configs) == expected
+
+
+def test_score_unknown_term(articles):
+    matrix = ArticleTermMatrix(articles, ['nhs'])
+    assert matrix.score([['nhs']], [[['nhs']]], min_core_df=2) == {0: 4/43, 4: 4/25}
+    with pytest.raises(KeyError):
+        matrix.score([['nhs']], [[['video call']]])
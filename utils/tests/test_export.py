@@ -0,0 +1,61 @@
+from utils.export import ranked_rows
+from utils.export import write_xlsx
+from utils.export import write_csv
+from utils.export import write_parquet
+from utils.near_duplicates import NearDuplicateIndex
+import pandas as pd
+import copy
+import pytest
+
+
+@pytest.fixture
+def articles():
+    return [dict(source=dict(id=None, name=f'Source {i}'), author=None,
+                 title=f'Title {i % 4}', description=f'Description {i}',
+                 url=f'https://news.example/{i}', urlToImage=None,
+                 publishedAt=f'2020-03-{i+1:02d}T12:00:00Z', content=f'Content {i}')
+            for i in range(6)]
+
+
+@pytest.fixture
+def ranked_articles():
+    return {0: 0.5, 1: 2.5, 3: 1.5, 4: 3.5, 5: 0.1}
+
+
+def test_ranked_rows(articles, ranked_articles):
+    original = copy.deepcopy(articles)
+    rows = list(ranked_rows(ranked_articles, articles))
+    assert [row['url'] for row in rows] == ['https://news.example/4',
+                                            'https://news.example/1',
+                                            'https://news.example/3']
+    assert rows[0]['source'] == 'Source 4'
+    assert rows[0]['score'] == 3.5
+    assert articles == original
+
+
+def test_ranked_rows_near_duplicates(articles, ranked_articles):
+    articles[3]['title'] = 'Title 1 - Source 3'
+    articles[3]['content'] = articles[1]['content']
+    rows = list(ranked_rows(ranked_articles, articles, NearDuplicateIndex()))
+    assert 'https://news.example/3' not in [row['url'] for row in rows]
+
+
+@pytest.mark.parametrize('batch_size', [2, 10000])
+def test_writers(tmp_path, articles, ranked_articles, batch_size):
+    filename = str(tmp_path / 'ranked.xlsx')
+    write_xlsx(ranked_rows(ranked_articles, articles), filename, batch_size=batch_size)
+    xlsx = pd.read_excel(filename, index_col=0)
+    assert xlsx['publishedAt'].tolist() == ['05/03/2020', '02/03/2020',
+                                            '04/03/2020']
+    assert xlsx['score'].tolist() == [3.5, 2.5, 1.5]
+
+    filename = str(tmp_path / 'ranked.csv')
+    write_csv(ranked_rows(ranked_articles, articles), filename, batch_size=batch_size)
+    pd.testing.assert_frame_equal(pd.read_csv(filename), xlsx.reset_index(drop=True))
+
+    filename = str(tmp_path / 'ranked.parquet')
+    write_parquet(ranked_rows(ranked_articles, articles), filename, batch_size=batch_size)
+    parquet = pd.read_parquet(filename)
+    assert parquet['author'].isnull().all()
+    assert parquet.drop(columns='author').values.tolist() == \
+        xlsx.drop(columns='author').values.tolist()
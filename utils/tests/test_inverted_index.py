@@ -0,0 +1,58 @@
+import pytest
+
+from utils.inverted_index import InvertedIndex
+from utils.keyword_filter import filter_articles
+
+
+@pytest.fixture
+def articles():
+    return [dict(title='a', content='The NHS: video calls, video call and video calls',
+                 description=None),
+            dict(title='b', content=None, description='NHSX video call video call'),
+            dict(title='b', content='nhs video call', description=None),
+            dict(title='c', content=None, description=None),
+            dict(title='d', content='nhs nhs nhs, but no video', description=None)]
+
+
+@pytest.fixture
+def index(articles):
+    return InvertedIndex.from_articles(articles)
+
+
+def test_phrase_counts(index):
+    assert index.phrase_counts('nhs') == {0: 1, 2: 1, 4: 3}
+    assert index.phrase_counts('Video Calls') == {0: 2}
+    assert index.phrase_counts('video call') == {0: 1, 1: 2, 2: 1}
+    assert index.phrase_counts('call video') == {1: 1}
+    assert index.phrase_counts('telehealth') == {}
+    assert index.counts(['nhs', 'nhs', 'video']) == {0: 5, 1: 2, 2: 3, 4: 7}
+
+
+def test_phrase_counts_non_overlapping():
+    index = InvertedIndex.from_docs([['a', 'a', 'a', 'b'], ['a', 'a', 'a', 'a']])
+    assert index.phrase_counts('a a') == {0: 1, 1: 2}
+
+
+def test_docs_containing():
+    docs = [['video', 'call'], ['video'], ['call', 'video', 'nhs']]
+    index = InvertedIndex.from_docs(docs)
+    assert index.docs_containing(['video', 'call']) == {0, 2}
+    assert index.docs_containing(['nhs', 'telehealth']) == set()
+
+
+def test_incremental_and_persistent(articles, tmp_path):
+    index = InvertedIndex.from_articles(articles[:2])
+    index.add_articles(articles[2:], start=2)
+    with pytest.raises(ValueError):
+        index.add_text(0, 'nhs')
+    filename = str(tmp_path / 'index.pkl')
+    index.save(filename)
+    index = InvertedIndex.load(filename)
+    assert len(index) == 4
+    assert index.phrase_counts('nhs') == {0: 1, 2: 1, 4: 3}
+
+
+def test_filter_articles_with_index(articles, index):
+    ranked_articles = filter_articles(articles, [['nhs']], [[['video'], ['call']]],
+                                      min_core_df=1, index=index)
+    assert ranked_articles == {0: 1*3/len(articles[0]['content'])}
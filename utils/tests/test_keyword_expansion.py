@@ -1,5 +1,10 @@
 from utils.keyword_expansion import matrix_fraction
 from utils.keyword_expansion import jlh
+from utils.keyword_expansion import keyword_expansion
+from utils.keyword_expansion import ExpansionEngine
+from utils.keyword_expansion import jlh_scores
+from utils.keyword_expansion import top_keywords
+from scipy.sparse import csr_matrix
 
 import numpy as np
 import pytest
@@ -26,3 +31,40 @@ def test_matrix_fraction(a, b):
 
 def test_jlh(a, b):
     assert jlh(a, b) == [frac(-8, 144), frac(-8, 144), frac(32, 144)]
+
+
+@pytest.fixture
+def docs():
+    return [['nhs', 'covid', 'hospital'], ['nhs', 'covid', 'ventilator', 'hospital'],
+            ['covid', 'lockdown'], ['football', 'match'], ['nhs', 'staff'],
+            ['covid', 'vaccine', 'trial'], ['football', 'covid', 'match']]
+
+
+def test_expansion_engine(docs, tmp_path):
+    engine = ExpansionEngine(docs)
+    assert engine.search_docs(['nhs', 'covid']).tolist() == [0, 1]
+    assert engine.search_docs(['nhs', 'unknown']).tolist() == []
+    for search_terms in ['nhs', 'covid', 'nhs covid', 'football']:
+        assert engine.query(search_terms) == keyword_expansion(docs, search_terms)
+
+    filename = str(tmp_path / 'engine.pkl')
+    engine.save(filename)
+    assert ExpansionEngine.load(filename).query('nhs covid') == engine.query('nhs covid')
+
+
+def test_jlh_scores_sparse(a, b):
+    assert jlh_scores(csr_matrix(a), csr_matrix(b)).tolist() == jlh(a, b)
+    # Features missing from the background score zero, as do all features of an empty foreground
+    assert jlh_scores(np.array([[1, 1]]), np.array([[2, 0]])).tolist() == [-0.25, 0]
+    assert jlh_scores(np.array([[0, 0]]), np.array([[2, 1]])).tolist() == [0, 0]
+
+
+def test_top_keywords():
+    scores = np.array([0.5, -0.2, 0.1, -0.2, 0.3, -0.4, 0.0])
+    keyword_idxs, unkeyword_idxs = top_keywords(scores, [4], threshold=0.3, n_unkeywords=3)
+    assert keyword_idxs.tolist() == [0, 2, 4]
+    assert unkeyword_idxs.tolist() == [5, 1, 3]
+    _, unkeyword_idxs = top_keywords(scores, [4], n_unkeywords=2)
+    assert unkeyword_idxs.tolist() == [5, 1]
+    _, unkeyword_idxs = top_keywords(scores, [4], n_unkeywords=100)
+    assert len(unkeyword_idxs) == len(scores)
@@ -1,5 +1,12 @@
 from utils.keyword_filter import _expand_terms
 from utils.keyword_filter import expand_terms
+from utils.keyword_filter import filter_articles
+from utils.keyword_filter import iter_filter_articles
+from utils.keyword_filter import TermSet
+from utils.article_store import iter_jsonl
+from utils.article_store import write_jsonl
+import pickle
+import json
 
 
 def test__expand_terms_one_first_term():
@@ -27,3 +34,59 @@ def test_expand_terms():
                        'skype chat', 'skype chats', 'skype call', 'skype calls']*2
     assert sorted(expanded_terms) == sorted(expected_result)
 
+
+def test_filter_articles():
+    articles = [dict(title='a', content='NHS video calls and video chats for the nhs',
+                     description=None),
+                dict(title='a', content='nhs nhs video call', description=None),
+                dict(title='b', content=None, description='nhs video call'),
+                dict(title='c', content=None, description=None),
+                dict(title='d', content='nhs without any seed terms', description=None)]
+    ranked_articles = filter_articles(articles, [['nhs']],
+                                      [[['video'], ['call', 'chat']]],
+                                      min_core_df=1)
+    text = articles[0]['content'].lower()
+    assert ranked_articles == {0: 4*2/len(text), 2: 1*1/len('nhs video call')}
+
+
+def test_iter_filter_articles_streams(tmp_path):
+    articles = [dict(title=str(i), content=f'nhs video call {i}', description=None)
+                for i in range(3)]
+    filename = str(tmp_path / 'articles.jsonl')
+    write_jsonl(articles, filename)
+    results = iter_filter_articles(iter_jsonl(filename), [['nhs']],
+                                   [[['video'], ['call']]], min_core_df=1)
+    assert next(results) == (0, 1/len('nhs video call 0'), articles[0])
+    assert [i for i, _, _ in results] == [1, 2]
+
+
+def test_filter_articles_parallel():
+    articles = [dict(title=str(i % 40), content=f'nhs {"nhs " * (i % 3)}video call {i}',
+                     description=None) for i in range(100)]
+    args = (articles, [['nhs']], [[['video'], ['call']]])
+    assert filter_articles(*args, min_core_df=2, n_jobs=3) == \
+        filter_articles(*args, min_core_df=2)
+
+
+def test_term_set(tmp_path):
+    seed_terms = [[['video', 'skype'], ['chat', 'call']]]*2
+    plurals = str(tmp_path / 'plurals.json')
+    term_set = TermSet.from_seed_terms(seed_terms, plurals=plurals)
+    assert sorted(term_set) == sorted(set(expand_terms(seed_terms)))
+    assert json.load(open(plurals)) == {'chat': 'chats', 'call': 'calls'}
+    assert TermSet.from_seed_terms(seed_terms, plurals=plurals) == term_set
+
+    filename = str(tmp_path / 'terms.json')
+    term_set.save(filename)
+    assert TermSet.load(filename) == term_set
+    assert pickle.loads(pickle.dumps(term_set)) == term_set
+
+
+def test_filter_articles_term_set():
+    articles = [dict(title=str(i % 40), content=f'nhs {"nhs " * (i % 3)}video call {i}',
+                     description=None) for i in range(100)]
+    core_terms, seed_terms = [['nhs']], [[['video'], ['call']]]
+    term_sets = (TermSet.from_core_terms(core_terms), TermSet.from_seed_terms(seed_terms))
+    expected = filter_articles(articles, core_terms, seed_terms, min_core_df=2)
+    assert filter_articles(articles, *term_sets, min_core_df=2) == expected
+    assert filter_articles(articles, *term_sets, min_core_df=2, n_jobs=2) == expected
@@ -0,0 +1,61 @@
+from utils import metrics
+from utils.keyword_filter import filter_articles
+from collections import defaultdict
+import pytest
+import io
+import json
+
+
+def test_disabled_by_default():
+    metrics.disable()
+    events = []
+    metrics.enable(events.append)
+    metrics.disable()
+    metrics.count('things')
+    with metrics.timer('block'):
+        pass
+    assert events == []
+    assert metrics.summary() == {}
+
+
+def test_recording():
+    events = []
+    stream = io.StringIO()
+    with metrics.recording(events.append, metrics.json_hook(stream)):
+        metrics.count('things', 2, kind='a')
+        metrics.count('things')
+        with metrics.timer('block', label='x'):
+            pass
+    summary = metrics.summary()
+    assert summary['things'] == dict(type='counter', count=2, total=3)
+    assert summary['block']['count'] == 1
+    assert summary['block']['mean'] >= 0
+    assert [event['name'] for event in events] == ['things', 'things', 'block']
+    assert events[0]['labels'] == dict(kind='a')
+    assert [json.loads(line) for line in stream.getvalue().splitlines()] == events
+    assert not metrics.enabled()
+
+
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_filter_articles_metrics(n_jobs):
+    articles = [dict(title='a', content='nhs nhs video call', description=None),
+                dict(title='a', content='nhs nhs video call', description=None),
+                dict(title='b', content=None, description=None),
+                dict(title='c', content='no core terms', description=None),
+                dict(title='d', content='nhs nhs without seed terms', description=None)]
+    stream = io.StringIO()
+    with metrics.recording(metrics.json_hook(stream)):
+        ranked_articles = filter_articles(articles, [['nhs']], [[['video'], ['call']]],
+                                          min_core_df=2, min_seed_df=1, n_jobs=n_jobs)
+    assert list(ranked_articles) == [0]
+    totals = {name: total['total'] for name, total in metrics.summary().items()}
+    assert totals.pop('filter') >= 0
+    assert totals == {'filter.duplicates': 1, 'filter.no_text': 1,
+                      'filter.rejected_core': 1, 'filter.rejected_seed': 1,
+                      'filter.accepted': 1}
+    # Measurements in worker processes are in both the events and the summary
+    streamed = defaultdict(int)
+    for line in stream.getvalue().splitlines():
+        event = json.loads(line)
+        streamed[event['name']] += event['value']
+    assert {name: value for name, value in streamed.items() if name != 'filter'} == totals
@@ -0,0 +1,46 @@
+from utils.near_duplicates import NearDuplicateIndex
+from utils.near_duplicates import article_text
+from utils.keyword_filter import filter_articles
+
+import pytest
+
+CONTENT = ('Patients will be offered video consultations with their GP as the NHS '
+           'expands remote services during the coronavirus outbreak, the health '
+           'secretary announced on Tuesday')
+
+
+@pytest.fixture
+def articles():
+    return [dict(title='NHS expands video consultations - BBC News',
+                 content=CONTENT + '… [+2011 chars]', description=None),
+            dict(title='NHS expands video consultations | The Guardian',
+                 content=CONTENT + ' evening… [+1520 chars]', description=None),
+            dict(title='Hospital waiting lists grow',
+                 content='Waiting lists for routine operations in NHS hospitals '
+                         'have grown to their longest since records began',
+                 description=None)]
+
+
+def test_article_text(articles):
+    assert article_text(articles[0]) == ('nhs expands video consultations '
+                                         + CONTENT.lower())
+
+
+def test_is_duplicate(articles):
+    index = NearDuplicateIndex()
+    assert [index.is_duplicate(art) for art in articles] == [False, True, False]
+    assert len(index) == 2
+    assert index.find(articles[1]) == 0
+    assert index.find(dict(title='Something else entirely', content=None)) is None
+
+
+def test_bands_must_divide_num_perm():
+    with pytest.raises(ValueError):
+        NearDuplicateIndex(num_perm=100, bands=32)
+
+
+def test_filter_articles_near_duplicates(articles):
+    args = ([['nhs']], [[['video consultations']]])
+    assert set(filter_articles(articles, *args, min_core_df=1)) == {0, 1}
+    assert set(filter_articles(articles, *args, min_core_df=1,
+                               near_duplicates=NearDuplicateIndex())) == {0}
@@ -0,0 +1,208 @@
+import pytest
+import time
+from newsapi import const
+from newsapi.newsapi_exception import NewsAPIException
+
+from utils import news_api
+from utils import metrics
+from utils.news_api import TokenBucket
+from utils.news_api import download_articles
+from utils.news_api import get_articles
+from utils.news_api import plan_windows
+from utils.tests.fake_newsapi import FakeNewsAPI
+
+QUERY = dict(q='nhs', language='en', sort_by='publishedAt', page_size=2)
+
+
+@pytest.fixture
+def raw_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(news_api, 'news_api_key', lambda: 'test-key')
+    monkeypatch.setattr(news_api, 'datapath',
+                        lambda data_dirname, filename: str(tmp_path / filename))
+    return tmp_path
+
+
+def fake_newsapi(monkeypatch, **kwargs):
+    fake = FakeNewsAPI(**kwargs)
+    monkeypatch.setattr(const, 'EVERYTHING_URL', fake.url)
+    return fake
+
+
+def test_get_articles_paginates(raw_dir, monkeypatch):
+    with fake_newsapi(monkeypatch) as fake:
+        articles = list(get_articles(from_param='2020-03-01', to='2020-03-02', **QUERY))
+    assert len(articles) == 6
+    assert [params['page'] for params in fake.requests] == ['1', '2', '3']
+
+
+def test_get_articles_developer_limit(raw_dir, monkeypatch):
+    with fake_newsapi(monkeypatch, max_results=4):
+        articles = list(get_articles(from_param='2020-03-01', to='2020-03-02', **QUERY))
+    assert len(articles) == 4
+
+
+def test_get_articles_retries(raw_dir, monkeypatch):
+    with fake_newsapi(monkeypatch, n_failures=2):
+        with pytest.raises(NewsAPIException):
+            list(get_articles(from_param='2020-03-01', to='2020-03-01', **QUERY))
+    with fake_newsapi(monkeypatch, n_failures=2):
+        articles = list(get_articles(from_param='2020-03-01', to='2020-03-01',
+                                     max_retries=2, backoff=0, **QUERY))
+    assert len(articles) == 3
+
+
+def test_download_articles_concurrent_matches_sequential(raw_dir, monkeypatch):
+    with fake_newsapi(monkeypatch):
+        sequential = download_articles('sequential', start='1 March, 2020',
+                                       until='1 May, 2020', **QUERY)
+    with fake_newsapi(monkeypatch, n_failures=3):
+        concurrent = download_articles('concurrent', start='1 March, 2020',
+                                       until='1 May, 2020', n_workers=4,
+                                       rate_limit=1000, backoff=0, **QUERY)
+    assert len(sequential) == 2*57 + 1  # 1 March to 26 April
+    assert concurrent == sequential
+    assert (raw_dir / 'concurrent.json').exists()
+    assert (raw_dir / 'concurrent.arrow').exists()
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=100)
+    start = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    assert time.monotonic() - start >= 0.05
+
+
+def test_download_articles_resumes_from_chunks(raw_dir, monkeypatch):
+    with fake_newsapi(monkeypatch):
+        articles = download_articles('resume', start='1 March, 2020',
+                                     until='15 March, 2020', **QUERY)
+    assert len(articles) == 2*15 + 1
+    # Extending the date range only fetches the new week
+    with fake_newsapi(monkeypatch) as fake:
+        articles = download_articles('resume', start='1 March, 2020',
+                                     until='22 March, 2020', **QUERY)
+    assert {params['from'] for params in fake.requests} == {'2020-03-15'}
+    assert len(articles) == 2*22 + 1
+    # A rerun makes no API calls at all
+    with fake_newsapi(monkeypatch) as fake:
+        assert download_articles('resume', start='1 March, 2020',
+                                 until='22 March, 2020', **QUERY) == articles
+    assert fake.requests == []
+    assert len(list((raw_dir / 'resume').glob('2020-*.json'))) == 3
+
+
+def test_download_articles_only_merges_new_chunks(raw_dir, monkeypatch):
+    with fake_newsapi(monkeypatch):
+        articles = download_articles('merge', start='1 March, 2020',
+                                     until='15 March, 2020', **QUERY)
+    # Without new chunks, the merged corpus is loaded rather than rewritten
+    written = []
+    write_store = news_api.write_store
+    monkeypatch.setattr(news_api, 'write_store',
+                        lambda articles, filename: written.append(filename)
+                        or write_store(articles, filename))
+    with fake_newsapi(monkeypatch):
+        assert download_articles('merge', start='1 March, 2020',
+                                 until='15 March, 2020', **QUERY) == articles
+    assert written == []
+    # ...unless it is missing
+    (raw_dir / 'merge.arrow').unlink()
+    with fake_newsapi(monkeypatch):
+        assert download_articles('merge', start='1 March, 2020',
+                                 until='15 March, 2020', **QUERY) == articles
+    assert written == [str(raw_dir / 'merge.arrow')]
+
+
+def test_download_articles_between_dates(raw_dir, monkeypatch):
+    with fake_newsapi(monkeypatch):
+        download_articles('dates', start='1 March, 2020', until='29 March, 2020', **QUERY)
+    # Narrowing the date range only merges the chunks within it
+    with fake_newsapi(monkeypatch) as fake:
+        articles = download_articles('dates', start='1 March, 2020',
+                                     until='8 March, 2020', **QUERY)
+    assert fake.requests == []
+    assert len(articles) == 2*8 + 1
+    assert max(art['publishedAt'] for art in articles) < '2020-03-09'
+
+
+def test_download_articles_execution_kwargs(raw_dir, monkeypatch):
+    with fake_newsapi(monkeypatch):
+        articles = download_articles('execution', start='1 March, 2020',
+                                     until='15 March, 2020', backoff=0, verbose=True,
+                                     **QUERY)
+    # Settings which don't affect the articles aren't part of the query
+    with fake_newsapi(monkeypatch) as fake:
+        assert download_articles('execution', start='1 March, 2020',
+                                 until='15 March, 2020', **QUERY) == articles
+    assert fake.requests == []
+
+
+def test_download_articles_query_changed(raw_dir, monkeypatch):
+    with fake_newsapi(monkeypatch):
+        download_articles('query', start='1 March, 2020', until='15 March, 2020', **QUERY)
+    with fake_newsapi(monkeypatch) as fake, pytest.raises(ValueError):
+        download_articles('query', start='1 March, 2020', until='15 March, 2020',
+                          **dict(QUERY, q='covid'))
+    assert fake.requests == []
+
+
+def busy_articles(day):
+    '''One article per day, except for one busy day with one article per hour'''
+    date = day.strftime('%Y-%m-%d')
+    hours = range(24) if date == '2020-03-10' else [12]
+    return [dict(source=dict(id=None, name='Source'), author=None,
+                 title=f'Article on {date} at {hour}', description=None,
+                 url=f'https://news.example/{date}/{hour}', urlToImage=None,
+                 publishedAt=f'{date}T{hour:02d}:30:00Z', content='The NHS')
+            for hour in hours]
+
+
+def test_plan_windows(raw_dir, monkeypatch):
+    with fake_newsapi(monkeypatch, articles_for_day=busy_articles) as fake:
+        windows = plan_windows('1 March, 2020', '29 March, 2020',
+                               max_results=10, **QUERY)
+        results = [fake.articles(*window) for window in windows]
+    assert all(len(articles) <= 10 for articles in results)
+    assert len({art['title'] for articles in results for art in articles}) == 27 + 24
+    # Quiet periods are merged, busy periods are split
+    assert len(windows) < 10
+    assert all(a[1] == b[0] for a, b in zip(windows, windows[1:]))
+    assert windows[0][0] == '2020-03-01T00:00:00'
+    assert windows[-1][1] == '2020-03-29T00:00:00'
+
+
+def test_download_articles_adaptive(raw_dir, monkeypatch):
+    with fake_newsapi(monkeypatch, articles_for_day=busy_articles, max_results=10):
+        weekly = download_articles('weekly', start='1 March, 2020',
+                                   until='29 March, 2020', **QUERY)
+    with fake_newsapi(monkeypatch, articles_for_day=busy_articles, max_results=10):
+        adaptive = download_articles('adaptive', start='1 March, 2020',
+                                     until='29 March, 2020', adaptive=True,
+                                     max_results=10, **QUERY)
+    # The busy week is truncated when downloading in weeks
+    assert len(weekly) == 32
+    assert len(adaptive) == 27 + 24
+    # Nothing is planned or downloaded (so no API key is needed)
+    # for weeks which are already covered
+    monkeypatch.setattr(news_api, 'news_api_key', None)
+    with fake_newsapi(monkeypatch, articles_for_day=busy_articles) as fake:
+        assert download_articles('adaptive', start='1 March, 2020',
+                                 until='29 March, 2020', adaptive=True,
+                                 max_results=10, **QUERY) == adaptive
+    assert fake.requests == []
+
+
+def test_download_articles_metrics(raw_dir, monkeypatch):
+    with fake_newsapi(monkeypatch, n_failures=1), metrics.recording():
+        download_articles('metrics', start='1 March, 2020', until='15 March, 2020',
+                          backoff=0, **QUERY)
+    summary = metrics.summary()
+    assert summary['api.retries']['total'] == 1
+    # Each chunk has 8 days (inclusive) of 3 articles, with 2 articles per page
+    assert summary['api.pages']['total'] == 2*12
+    assert summary['api.request']['count'] == 2*12 + 1
+    assert summary['download.chunk']['count'] == 2
+    assert summary['download.articles']['total'] == 2*24
+    # Only one syndicated story, and 8 March is in both chunks
+    assert summary['download.duplicates']['total'] == 15 + 2
@@ -0,0 +1,16 @@
+from utils.parallel import map_shards
+from utils.parallel import shards
+
+
+def square_all(numbers):
+    return [n*n for n in numbers]
+
+
+def test_shards():
+    assert shards(list(range(7)), 3) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert shards(list(range(2)), 4) == [[0], [1]]
+    assert shards([], 4) == []
+
+
+def test_map_shards():
+    assert map_shards(square_all, list(range(50)), n_jobs=2) == square_all(range(50))
@@ -0,0 +1,91 @@
+from utils.phrase_condensation import condense_phrases
+from utils.phrase_condensation import embed
+from utils.phrase_condensation import FunctionEncoder
+from utils.phrase_condensation import HashingEncoder
+from utils.phrase_condensation import normalise
+from utils.phrase_condensation import remove_stop_prefixes
+from utils.phrase_condensation import TfidfEncoder
+from collections import defaultdict
+import numpy as np
+import pytest
+
+PHRASES = ['nhs app', 'the nhs app', 'nhs apps', 'video consultation',
+           'video consultations', 'remote monitoring', 'monitoring remotely',
+           'patient data', 'data of patients', 'covid']
+
+
+def naive_condense_phrases(phrases, embeddings, threshold):
+    '''The original all-pairs implementation'''
+    groups = defaultdict(list)
+    thesaurus = {}
+    already_grouped = set()
+    for irow, (term, row) in enumerate(zip(phrases, np.inner(embeddings, embeddings))):
+        if irow in already_grouped:
+            continue
+        for iterm, (_term, sim) in enumerate(zip(phrases, row)):
+            if irow == iterm or iterm in already_grouped:
+                continue
+            if sim > threshold:
+                thesaurus[_term] = term
+                groups[term].append(_term)
+                already_grouped.add(iterm)
+    return groups, thesaurus
+
+
+def test_remove_stop_prefixes():
+    stops = {'the', 'a', 'of'}
+    assert remove_stop_prefixes('the new nhs app', stops) == 'new nhs app'
+    assert remove_stop_prefixes('of the nhs', stops) == 'nhs'
+    assert remove_stop_prefixes('the', stops) == 'the'
+
+
+@pytest.mark.parametrize('block_size', [1, 3, 1024])
+@pytest.mark.parametrize('threshold', [0.3, 0.5, 0.7])
+def test_condense_phrases_matches_naive(block_size, threshold):
+    encoder = HashingEncoder()
+    expected = naive_condense_phrases(PHRASES, normalise(encoder.encode(PHRASES)),
+                                      threshold)
+    assert condense_phrases(PHRASES, encoder, threshold=threshold,
+                            block_size=block_size) == expected
+
+
+def test_condense_phrases():
+    groups, thesaurus = condense_phrases(PHRASES, HashingEncoder(), threshold=0.7,
+                                         stops={'the'})
+    assert groups['nhs app'] == ['the nhs app', 'nhs apps']
+    assert thesaurus['video consultations'] == 'video consultation'
+    assert 'covid' not in thesaurus
+    assert condense_phrases([], HashingEncoder()) == ({}, {})
+
+
+def test_condense_phrases_ann():
+    encoder = HashingEncoder()
+    exact = condense_phrases(PHRASES, encoder, threshold=0.7)
+    # With one plane per table, every phrase is compared to about half of the others
+    assert condense_phrases(PHRASES, encoder, threshold=0.7, ann=True,
+                            n_planes=1, n_tables=16) == exact
+    groups, thesaurus = condense_phrases(PHRASES, encoder, threshold=0.7, ann=True)
+    assert set(thesaurus.items()) <= set(exact[1].items())
+
+
+def test_embed_cache(tmp_path):
+    calls = []
+
+    def encode(phrases):
+        calls.append(phrases)
+        return [[len(phrase), 1] for phrase in phrases]
+
+    encoder = FunctionEncoder(encode, name='length')
+    cache = str(tmp_path / 'embeddings')
+    assert embed(['a', 'bb'], encoder, cache=cache).tolist() == [[1, 1], [2, 1]]
+    assert embed(['bb', 'ccc'], encoder, cache=cache).tolist() == [[2, 1], [3, 1]]
+    assert calls == [['a', 'bb'], ['ccc']]
+
+
+def test_tfidf_encoder():
+    encoder = TfidfEncoder(['nhs app', 'video consultation', 'nhs video'])
+    assert encoder.name == TfidfEncoder(['nhs app', 'video consultation', 'nhs video']).name
+    assert encoder.name != TfidfEncoder(['nhs app']).name
+    embeddings = normalise(encoder.encode(['nhs app', 'app nhs', 'video']))
+    assert embeddings[0] @ embeddings[1] == pytest.approx(1)
+    assert embeddings[0] @ embeddings[2] == 0
@@ -0,0 +1,98 @@
+from utils.phrase_counter import PhraseCounter
+from collections import Counter
+import random
+import pytest
+
+
+def replace_count(text, phrases, thesaurus={}):
+    '''Reference implementation: count and remove the longest phrases first'''
+    counts = Counter()
+    for phrase in sorted(phrases, key=len, reverse=True):
+        count = text.count(phrase)
+        if count > 0:
+            counts[thesaurus.get(phrase, phrase)] += count
+        text = text.replace(phrase, '|')
+    return counts
+
+
+def notebook_count(text, phrases, thesaurus={}):
+    '''The original loop of the news topics notebook, which removes each phrase
+    once it is counted'''
+    counts = Counter()
+    for phrase in sorted(phrases, key=len, reverse=True):
+        while phrase in text:
+            counts[thesaurus.get(phrase, phrase)] += 1
+            text = text.replace(phrase, '')
+    return counts
+
+
+def test_count():
+    counter = PhraseCounter(['app', 'nhs app', 'nhs', 'the nhs'],
+                            thesaurus={'the nhs': 'nhs'})
+    text = 'The NHS app and the nhs said the app is an NHS appliance'
+    assert counter.count(text) == Counter({'nhs app': 2, 'nhs': 1, 'app': 1})
+    assert counter.count(text) == replace_count(text.lower(), counter.phrases,
+                                                counter.thesaurus)
+    assert PhraseCounter([]).count(text) == Counter()
+
+
+def test_longest_phrase_takes_precedence():
+    # "b c d" is counted first, even though "a b" starts earlier
+    counter = PhraseCounter(['a b', 'b c d', 'a'])
+    assert counter.count('a b c d') == Counter({'b c d': 1, 'a': 1})
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_count_matches_replace(seed):
+    rng = random.Random(seed)
+    phrases = list({''.join(rng.choices('ab ', k=rng.randint(1, 5))) for _ in range(10)})
+    text = ''.join(rng.choices('ab ', k=200))
+    assert PhraseCounter(phrases).count(text) == replace_count(text, phrases)
+
+
+def test_count_matrix():
+    counter = PhraseCounter(['nhs app', 'app', 'nhs'])
+    assert counter.vocabulary == ['nhs app', 'app', 'nhs']
+    counts = counter.count_matrix(['nhs app app', '', 'NHS', 'app'])
+    assert counts.toarray().tolist() == [[1, 1, 0], [0, 0, 0], [0, 0, 1], [0, 1, 0]]
+    counts = counter.count_matrix(['app app'], binary=True)
+    assert counts.toarray().tolist() == [[0, 1, 0]]
+    # Phrases are counted under their canonical phrase
+    counter = PhraseCounter(['nhs app', 'the nhs', 'nhs'], thesaurus={'the nhs': 'nhs'})
+    assert counter.vocabulary == ['nhs app', 'nhs']
+    assert counter.count_matrix(['the nhs and nhs']).toarray().tolist() == [[0, 2]]
+
+
+def test_count_distinct():
+    thesaurus = {'the nhs': 'nhs', 'national health service': 'nhs'}
+    counter = PhraseCounter(['the nhs', 'national health service', 'nhs'], thesaurus)
+    text = 'the nhs, the national health service, and nhs'
+    assert counter.count(text, distinct=True) == Counter({'nhs': 3})
+    assert counter.count(text, distinct=True) == notebook_count(text, counter.phrases,
+                                                                thesaurus)
+    assert counter.count('nhs nhs', distinct=True) == Counter({'nhs': 1})
+    assert counter.count('nhs nhs') == Counter({'nhs': 2})
+    assert counter.count_matrix([text], binary=True).toarray().tolist() == [[1]]
+
+
+def test_count_matrix_distinct_matches_notebook():
+    thesaurus = {'nhs app': 'nhs app', 'the nhs app': 'nhs app', 'nhsx': 'nhsx',
+                 'the nhs': 'nhs', 'national health service': 'nhs', 'nhs': 'nhs',
+                 'video consultations': 'video consultation',
+                 'video consultation': 'video consultation',
+                 'online consultation': 'video consultation',
+                 'app': 'app', 'apps': 'app', 'contact tracing app': 'contact tracing',
+                 'contact tracing': 'contact tracing'}
+    texts = ['The NHS app will offer video consultations, the NHS said, and the '
+             'national health service expects online consultation to grow.',
+             'NHSX is building a contact tracing app. Contact tracing apps and the '
+             'NHS app are different apps, says the nhs.',
+             'Video consultation, video consultations: the NHS app, the NHS app.',
+             'Nothing to see here.',
+             '']
+    counter = PhraseCounter(list(thesaurus), thesaurus)
+    counts = counter.count_matrix(texts, distinct=True).toarray()
+    for text, row in zip(texts, counts):
+        expected = notebook_count(text.lower(), counter.phrases, thesaurus)
+        assert {word: count for word, count in zip(counter.vocabulary, row)
+                if count} == expected
@@ -0,0 +1,164 @@
+import copy
+import csv
+import json
+import pickle
+import pytest
+import os
+from newsapi import const
+
+from utils import article_store
+from utils import metrics
+from utils import news_api
+from utils import pipeline
+from utils.pipeline import label_config
+from utils.pipeline import main
+from utils.pipeline import run
+from utils.pipeline import stage_key
+from utils.tests.fake_newsapi import FakeNewsAPI
+
+CONFIG = {'core_terms': [['nhs']],
+          'seed_terms': [[['said'], ['0', '1']]],
+          'query': {'language': 'en', 'page_size': 10},
+          'filter': {'min_core_df': 1},
+          'export': {'formats': ['csv']},
+          'labels': {'march': {'start': '1 March, 2020', 'until': '15 March, 2020'},
+                     'april': {'start': '1 April, 2020', 'until': '15 April, 2020',
+                               'filter': {'min_seed_df': 2}}}}
+
+
+@pytest.fixture
+def fake(tmp_path, monkeypatch):
+    def _datapath(data_dirname, filename):
+        (tmp_path / data_dirname).mkdir(exist_ok=True)
+        return str(tmp_path / data_dirname / filename)
+    monkeypatch.setattr(news_api, 'news_api_key', lambda: 'test-key')
+    monkeypatch.setattr(news_api, 'datapath', _datapath)
+    monkeypatch.setattr(pipeline, 'datapath', _datapath)
+    monkeypatch.setattr(article_store, 'datapath', _datapath)
+    fake = FakeNewsAPI()
+    monkeypatch.setattr(const, 'EVERYTHING_URL', fake.url)
+    with fake:
+        yield fake
+
+
+def test_stage_key():
+    assert stage_key('filter', dict(min_core_df=1)) == stage_key('filter', dict(min_core_df=1))
+    assert stage_key('filter', dict(min_core_df=1)) != stage_key('filter', dict(min_core_df=2))
+    assert stage_key('filter', dict(min_core_df=1)) != stage_key('filter', dict(min_core_df=1), 'a')
+    # Execution settings don't change the output
+    assert stage_key('filter', dict(min_core_df=1)) == \
+        stage_key('filter', dict(min_core_df=1, n_jobs=4))
+
+
+def test_label_config():
+    settings = label_config(CONFIG, 'april')
+    assert settings['download']['query'] == dict(q='("nhs")', language='en', page_size=10)
+    assert settings['download']['start'] == '1 April, 2020'
+    assert settings['filter']['min_core_df'] == 1
+    assert settings['filter']['min_seed_df'] == 2
+    assert 'tokenize' not in settings
+
+
+def test_label_config_nhs_digital_shift():
+    filename = os.path.join(os.path.dirname(pipeline.__file__), 'configs',
+                            'nhs_digital_shift.json')
+    with open(filename) as f:
+        config = json.load(f)
+    assert list(label_config(config, 'nhs_since_june2019')) == ['download', 'filter']
+    settings = label_config(config, 'nhs_since_march_2')
+    assert list(settings) == ['download', 'filter', 'export']
+    assert settings['export'] == dict(formats=['xlsx'], name='nhsx_digital_shift_news_v2')
+
+
+def test_run(fake, tmp_path):
+    reports = run(CONFIG, n_jobs=2)
+    assert all(not info['skipped'] for report in reports.values()
+               for info in report.values())
+    assert list(reports['march']) == ['download', 'filter', 'export']
+    assert (tmp_path / 'outputs' / 'march.csv').exists()
+    assert (tmp_path / 'processed' / 'filtered_april.json').exists()
+    n_requests = len(fake.requests)
+    # Only a reference to the raw articles is cached by the download stage
+    key = reports['march']['download']['key']
+    with open(tmp_path / 'processed' / 'pipeline' / f'download-{key}.pkl', 'rb') as f:
+        assert pickle.load(f) == pipeline.raw_store('march')
+
+    # Nothing is rerun
+    reports = run(CONFIG, labels=['march'])
+    assert all(info['skipped'] for info in reports['march'].values())
+    assert len(fake.requests) == n_requests
+
+    # Changing a seed term only reruns filtering and export
+    config = copy.deepcopy(CONFIG)
+    config['seed_terms'][0][1].append('2')
+    reports = run(config)
+    assert {stage: info['skipped'] for stage, info in reports['march'].items()} == \
+        dict(download=True, filter=False, export=False)
+    assert len(fake.requests) == n_requests
+
+    # Missing outputs are rewritten, and stages can be forced
+    (tmp_path / 'outputs' / 'march.csv').unlink()
+    reports = run(config, labels=['march'], force=['filter'])
+    assert {stage: info['skipped'] for stage, info in reports['march'].items()} == \
+        dict(download=True, filter=False, export=False)
+    assert (tmp_path / 'outputs' / 'march.csv').exists()
+    (tmp_path / 'processed' / 'filtered_march.json').unlink()
+    reports = run(config, labels=['march'])
+    assert {stage: info['skipped'] for stage, info in reports['march'].items()} == \
+        dict(download=True, filter=False, export=True)
+    assert (tmp_path / 'processed' / 'filtered_march.json').exists()
+
+    # Missing raw articles are rebuilt, but unchanged articles aren't refiltered
+    (tmp_path / 'raw' / 'march.json').unlink()
+    reports = run(config, labels=['march'])
+    assert {stage: info['skipped'] for stage, info in reports['march'].items()} == \
+        dict(download=False, filter=True, export=True)
+    assert (tmp_path / 'raw' / 'march.json').exists()
+
+
+def test_run_reads_store(fake, tmp_path):
+    run(CONFIG, labels=['march'])
+    with open(tmp_path / 'raw' / 'march.json') as f:
+        articles = json.load(f)
+    with open(tmp_path / 'processed' / 'filtered_march.json') as f:
+        ranked_articles = json.load(f)
+    expected = [articles[int(idx)]['title'] for idx, rank in
+                sorted(ranked_articles.items(), key=lambda item: -item[1])]
+    # The raw JSON isn't read by the filter and export stages
+    (tmp_path / 'raw' / 'march.json').write_text('[]')
+    run(CONFIG, labels=['march'], force=['filter', 'export'])
+    with open(tmp_path / 'processed' / 'filtered_march.json') as f:
+        assert json.load(f) == ranked_articles
+    with open(tmp_path / 'outputs' / 'march.csv') as f:
+        titles = [row['title'] for row in csv.DictReader(f)]
+    assert titles == [title for i, title in enumerate(expected) if title not in expected[:i]]
+
+
+def test_run_export_name(fake, tmp_path):
+    config = copy.deepcopy(CONFIG)
+    config['labels']['march']['export'] = {'name': 'march_news'}
+    run(config, labels=['march'])
+    assert (tmp_path / 'outputs' / 'march_news.csv').exists()
+    assert not (tmp_path / 'outputs' / 'march.csv').exists()
+
+
+def test_main(fake, tmp_path, capsys):
+    filename = tmp_path / 'config.json'
+    filename.write_text(json.dumps(CONFIG))
+    main([str(filename), '--labels', 'march'])
+    main([str(filename), '--labels', 'march'])
+    assert capsys.readouterr().out.splitlines() == [
+        'march: download (ran), filter (ran), export (ran)',
+        'march: download (cached), filter (cached), export (cached)']
+
+
+def test_main_disables_metrics(tmp_path, monkeypatch):
+    filename = tmp_path / 'config.json'
+    filename.write_text(json.dumps(CONFIG))
+
+    def fail(*args, **kwargs):
+        raise RuntimeError
+    monkeypatch.setattr(pipeline, 'run', fail)
+    with pytest.raises(RuntimeError):
+        main([str(filename), '--metrics'])
+    assert not metrics.enabled()
@@ -0,0 +1,95 @@
+from utils.relevance_classifier import CountCache, grid_search, train_classifier
+from utils.relevance_classifier import score_docs, save_classifier, load_classifier
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.ensemble import RandomForestClassifier
+import numpy as np
+import itertools
+import random
+import pytest
+
+WORDS = ['nhs', 'app', 'digital', 'video', 'consultation', 'patient', 'data',
+         'football', 'weather', 'election', 'market', 'the', 'said', 'today']
+
+
+def make_docs(n, words, seed):
+    rng = random.Random(seed)
+    return [[rng.choice(words) for _ in range(rng.randint(5, 15))] for _ in range(n)]
+
+
+@pytest.fixture
+def docs():
+    signal, background = WORDS[:7] + WORDS[-3:], WORDS[7:]
+    return (make_docs(30, signal, 0), make_docs(30, background, 1),
+            make_docs(10, signal, 2), make_docs(10, background, 3))
+
+
+@pytest.mark.parametrize('min_df,max_df,ngram_max',
+                         [(1, 1.0, 1), (2, 0.5, 2), (0.05, 20, 3), (3, 0.9, 2)])
+def test_count_cache_features(docs, min_df, max_df, ngram_max):
+    signal, background, valid_signal, valid_background = docs
+    train = [' '.join(doc) for doc in signal + background]
+    valid = [' '.join(doc) for doc in valid_signal + valid_background]
+    vectorizer = TfidfVectorizer(min_df=min_df, max_df=max_df, ngram_range=(1, ngram_max))
+    expected_X = vectorizer.fit_transform(train)
+    expected_X0 = vectorizer.transform(valid)
+
+    counts = CountCache(signal + background, valid_signal + valid_background, 3)
+    X, X0 = counts.features(min_df=min_df, max_df=max_df, ngram_max=ngram_max)
+    assert X.shape == expected_X.shape
+    assert np.allclose(X.toarray(), expected_X.toarray())
+    assert np.allclose(X0.toarray(), expected_X0.toarray())
+
+
+def test_count_cache_no_features(docs):
+    counts = CountCache(docs[0], docs[2], 1)
+    with pytest.raises(ValueError):
+        counts.features(min_df=1000)
+
+
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_grid_search(docs, n_jobs):
+    signal, background, valid_signal, valid_background = docs
+    grid = dict(min_dfs=(1, 3), max_dfs=(1.0, 0.5), ngram_maxes=(1, 2),
+                n_estimators=(5,), max_depths=(2, None))
+    results = grid_search(*docs, n_jobs=n_jobs, **grid)
+    assert len(results) == 16
+    scores = [result['score'] for result in results]
+    assert scores == sorted(scores, reverse=True)
+
+    # Same scores as refitting the vectorizer for every combination
+    train = [' '.join(doc) for doc in signal + background]
+    valid = [' '.join(doc) for doc in valid_signal + valid_background]
+    y = [1]*len(signal) + [0]*len(background)
+    y0 = [1]*len(valid_signal) + [0]*len(valid_background)
+    expected = {}
+    for min_df, max_df, ngram_max, n_estimators, max_depth in itertools.product(*grid.values()):
+        vectorizer = TfidfVectorizer(min_df=min_df, max_df=max_df, ngram_range=(1, ngram_max))
+        X = vectorizer.fit_transform(train)
+        clf = RandomForestClassifier(n_estimators=n_estimators, max_depth=max_depth,
+                                     random_state=0)
+        clf.fit(X, y)
+        expected[min_df, max_df, ngram_max, n_estimators, max_depth] = \
+            clf.score(vectorizer.transform(valid), y0)
+    assert {(r['min_df'], r['max_df'], r['ngram_max'], r['n_estimators'],
+             r['max_depth']): r['score'] for r in results} == expected
+
+
+def test_grid_search_iterators(docs):
+    results = grid_search(*docs, min_dfs=iter([1, 2]), ngram_maxes=(n for n in [1, 2]),
+                          n_estimators=iter([5]))
+    assert len(results) == 4
+    assert {(r['min_df'], r['ngram_max']) for r in results} == {(1, 1), (1, 2), (2, 1), (2, 2)}
+
+
+def test_train_save_load(docs, tmp_path):
+    signal, background, valid_signal, valid_background = docs
+    classifier = train_classifier(signal, background, min_df=2, ngram_max=2,
+                                  n_estimators=10)
+    scores = score_docs(classifier, valid_signal + valid_background)
+    assert scores.shape == (20,)
+    assert scores[:10].mean() > scores[10:].mean()
+
+    filename = str(tmp_path / 'classifier.joblib')
+    save_classifier(classifier, filename)
+    assert np.array_equal(score_docs(load_classifier(filename),
+                                     valid_signal + valid_background), scores)
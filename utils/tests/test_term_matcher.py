@@ -0,0 +1,35 @@
+from utils.term_matcher import TermMatcher
+
+import random
+
+
+def test_count_matches_str_count():
+    terms = ['video call', 'video calls', 'call', 'aa', 'a', 'nhs',
+             'national health service', 'nhs digital', 'call']
+    matcher = TermMatcher(terms)
+    text = ('the nhs digital video calls nhsx aaa national health service '
+            'video call, call a a aaaa')
+    assert matcher.count(text) == [text.count(term) for term in terms]
+    assert matcher.total(text) == sum(text.count(term) for term in terms)
+
+
+def test_count_random_texts():
+    random.seed(0)
+    terms = ['ab', 'aba', 'b', 'bab', 'abab', 'c', 'ab']
+    matcher = TermMatcher(terms)
+    for _ in range(200):
+        text = ''.join(random.choice('abc ') for _ in range(30))
+        assert matcher.count(text) == [text.count(term) for term in terms]
+
+
+def test_count_edge_cases():
+    assert TermMatcher([]).count('some text') == []
+    assert TermMatcher(['']).count('abc') == ['abc'.count('')]
+    assert TermMatcher(['a.c', '(b']).count('abc a.c (b') == [1, 1]
+
+
+def test_matches():
+    matcher = TermMatcher(['nhs', 'nhs app', 'app', 'pp', ''])
+    assert list(matcher.matches('the nhs app')) == [('nhs', 4, 7), ('nhs app', 4, 11),
+                                                    ('app', 8, 11), ('pp', 9, 11)]
+    assert list(TermMatcher([]).matches('the nhs app')) == []
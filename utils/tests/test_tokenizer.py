@@ -0,0 +1,67 @@
+import pytest
+
+try:
+    from utils import tokenizer
+except LookupError:  # The NLTK stopwords corpus is required by utils.tokenizer
+    pytest.skip('NLTK stopwords corpus not available', allow_module_level=True)
+from utils.tokenizer import tokenize
+from utils.tokenizer import add_phrases
+from utils.tokenizer import load_phrasers
+from utils.tokenizer import train_phrasers
+
+
+class FakeToken(str):
+    @property
+    def lemma_(self):
+        return self.rstrip('s')
+
+
+class FakePipeline:
+    '''Stands in for spaCy, "lemmatizing" by removing trailing s'''
+    def __init__(self):
+        self.texts = []
+
+    def pipe(self, texts, batch_size):
+        for text in texts:
+            self.texts.append(text)
+            yield [FakeToken(token) for token in text.split()]
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    pipeline = FakePipeline()
+    monkeypatch.setattr(tokenizer, 'nlp', lambda: pipeline)
+    return pipeline
+
+
+def test_tokenize(pipeline):
+    articles = [dict(title='Title', content='NHS video consultations in 2020',
+                     description=None),
+                dict(title='Remote title', content=None, description=None)]
+    assert tokenize(articles, 'content') == [['nhs', 'video', 'consultation'],
+                                             ['remote', 'title']]
+
+
+def test_tokenize_cache(pipeline, tmp_path):
+    articles = [dict(title=None, content=f'{i} remote consultations', description=None)
+                for i in range(3)]
+    cache = str(tmp_path / 'tokens')
+    docs = tokenize(articles[:2], 'content', cache=cache)
+    assert len(pipeline.texts) == 2
+    assert tokenize(articles, 'content', cache=cache) == docs + docs[:1]
+    assert len(pipeline.texts) == 3
+
+
+def test_phrasers(tmp_path):
+    docs = [['nhs', 'video', 'call', 'service']]*5 + \
+        [[f'word{i}', f'word{i+1}', f'word{i+2}'] for i in range(0, 60, 3)]
+    _docs = [list(doc) for doc in docs]
+    filename = str(tmp_path / 'phrasers.pkl')
+    train_phrasers(docs, size=3, min_count=2, threshold=1, filename=filename)
+    phrasers = load_phrasers(filename)
+    phrased_docs = add_phrases(docs, phrasers)
+    assert next(phrased_docs) == docs[0] + ['nhs_video', 'call_service',
+                                            'nhs_video_call_service']
+    assert next(phrased_docs) == docs[1] + ['nhs_video', 'call_service',
+                                            'nhs_video_call_service']
+    assert docs == _docs  # Unchanged
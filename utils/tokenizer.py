@@ -1,10 +1,28 @@
-from nltk.tokenize import RegexpTokenizer
 from nltk.corpus import stopwords
-from gensim.models.phrases import Phrases
+from gensim.models.phrases import Phrases, Phraser
+from utils.tokens import split_tokens
+from utils.parallel import map_shards
+from utils import metrics
+from functools import lru_cache
+from contextlib import nullcontext
+from collections import Counter
+import hashlib
+import pickle
+import shelve
 
 STOPHTML = ['nbsp', 'amp', 'gt', 'lt', 'quot', 'apos',
             'td', 'tr', 'li', 'ul', 'al']
 STOPWORDS = set(list(stopwords.words('english') + STOPHTML))
+SPACY_MODEL = 'en_core_web_sm'
+SPACY_DISABLE = ['parser', 'ner']  # Only lemmas are required
+JOINER = '-'  # Never output by split_tokens
+
+
+@lru_cache(1)
+def nlp():
+    '''The spaCy pipeline, loaded on first use, without unused components'''
+    import spacy
+    return spacy.load(SPACY_MODEL, disable=SPACY_DISABLE)
 
 
 def grammer(docs, size, min_frac=0.1, min_count=100, igram=2):
@@ -24,7 +42,144 @@ def grammer(docs, size, min_frac=0.1, min_count=100, igram=2):
     return docs
 
 
-def tokenize(articles, field):
+def _new_tokens(tokens, phrased_tokens):
+    '''Tokens formed by a phraser, i.e. in the output but not the input'''
+    remaining = Counter(phrased_tokens) - Counter(tokens)
+    new_tokens = []
+    for token in phrased_tokens:
+        if remaining[token] > 0:
+            new_tokens.append(token)
+            remaining[token] -= 1
+    return new_tokens
+
+
+def _phrase_levels(doc, phrasers):
+    '''Apply phrasers in order, yielding the tokens input to and output from each.
+    Words within n-grams are joined by JOINER rather than "_" between phrasers,
+    since gensim>=4 can't learn phrases from tokens containing its delimiter.'''
+    tokens = [token.replace('_', JOINER) for token in doc]
+    for phraser in phrasers:
+        phrased_tokens = [token.replace('_', JOINER) for token in phraser[tokens]]
+        yield tokens, phrased_tokens
+        tokens = phrased_tokens
+
+
+def _phrase_tokens(doc, phrasers):
+    '''Fully phrased tokens, with words within n-grams joined by JOINER'''
+    tokens = [token.replace('_', JOINER) for token in doc]
+    for tokens, phrased_tokens in _phrase_levels(doc, phrasers):
+        tokens = phrased_tokens
+    return tokens
+
+
+def _phrase(doc, phrasers):
+    '''Apply phrasers in order, returning the doc with all new n-grams appended'''
+    new_tokens = []
+    for tokens, phrased_tokens in _phrase_levels(doc, phrasers):
+        new_tokens += _new_tokens(tokens, phrased_tokens)
+    return doc + [token.replace(JOINER, '_') for token in new_tokens]
+
+
+def train_phrasers(docs, size=3, min_frac=0.1, min_count=100, filename=None,
+                   **phrases_kwargs):
+    '''Train frozen phrase models in :obj:`size` - 1 passes, as in :obj:`grammer`.
+    Each pass is trained on the output of the previous passes, streamed over the
+    docs (which are not modified), and can join two tokens which are already
+    n-grams, so the longest n-grams have up to 2**(:obj:`size` - 1) words
+    (e.g. "nhs_video_call_service" for size=3).
+
+    Args:
+        docs (list): Tokenized documents.
+        size (int): One more than the number of phrasing passes.
+        min_frac, min_count: Minimum count of phrases, as in :obj:`grammer`.
+        filename (str): Optionally save the phrasers to this path.
+        phrases_kwargs: Any other kwargs for gensim's :obj:`Phrases` (e.g. threshold).
+    Returns:
+        phrasers (list): Frozen phrase models, in the order of the passes.
+    '''
+    frac_count = int(min_frac*len(docs))
+    min_count = min_count if min_count < frac_count else frac_count
+    if min_count < 2:
+        min_count = 2
+    phrasers = []
+    for _ in range(2, size + 1):
+        phrased_docs = (_phrase_tokens(doc, phrasers) for doc in docs)
+        phrases = Phrases(phrased_docs, min_count=min_count, **phrases_kwargs)
+        phrasers.append(Phraser(phrases))
+    if filename is not None:
+        save_phrasers(phrasers, filename)
+    return phrasers
+
+
+def add_phrases(docs, phrasers):
+    '''Add n-gram tokens to docs in a single pass, without modifying the input.
+
+    Args:
+        docs (iterable): Tokenized documents.
+        phrasers (list): Phrase models from :obj:`train_phrasers`.
+    Yields:
+        doc (list): The tokens of each doc, followed by any n-gram tokens.
+    '''
+    for doc in docs:
+        yield _phrase(doc, phrasers)
+
+
+def save_phrasers(phrasers, filename):
+    with open(filename, 'wb') as f:
+        pickle.dump(phrasers, f)
+
+
+def load_phrasers(filename):
+    with open(filename, 'rb') as f:
+        return pickle.load(f)
+
+
+def _lemmatize_and_split(texts, batch_size=1000):
+    '''Lemmatize and split texts into words, removing numbers'''
+    # Lemmatize
+    docs = [' '.join(token.lemma_ if token.lemma_ != '-PRON-'
+                     else str(token) for token in doc)
+            for doc in nlp().pipe(texts, batch_size=batch_size)]
+
+    # Convert to lowercase, and split into words (removing non-alphanums)
+    docs = [split_tokens(doc) for doc in docs]
+
+    # Remove numbers
+    return [[token for token in doc if not token.isnumeric()] for doc in docs]
+
+
+def _cache_key(text):
+    return hashlib.sha1(f'{SPACY_MODEL}\n{text}'.encode()).hexdigest()
+
+
+def tokenize(articles, field, n_jobs=1, cache=None, batch_size=1000,
+             phrasers=None):
+    '''Lemmatize and tokenize articles, removing numbers, short
+    tokens and stopwords.
+
+    Args:
+        articles (list): Articles (dict) in the NewsAPI format.
+        field (str): Field to tokenize, falling back on content, description
+                     and then title if it is missing.
+        n_jobs (int): Number of processes over which to shard lemmatization.
+        cache (str): Optional path to an on-disk cache (:obj:`shelve`) of
+                     lemmatized tokens, keyed by a hash of the text. Only texts
+                     missing from the cache are lemmatized.
+        batch_size (int): Number of texts per batch passed through spaCy.
+        phrasers (list or int): Phrase models from :obj:`train_phrasers`, with which to
+                                add n-grams to the docs. If an int, phrase models
+                                up to this n-gram order are trained on the docs.
+    Returns:
+        docs (list): List of tokens for each article.
+    '''
+    with metrics.timer('tokenize', n_jobs=n_jobs):
+        docs = _tokenize(articles, field, n_jobs=n_jobs, cache=cache,
+                         batch_size=batch_size, phrasers=phrasers)
+    metrics.count('tokenize.docs', len(docs))
+    return docs
+
+
+def _tokenize(articles, field, n_jobs, cache, batch_size, phrasers):
     _docs = []
     for article in articles:
         for _field in [field, 'content', 'description', 'title']:
@@ -35,21 +190,28 @@ def tokenize(articles, field):
             text = ''
         _docs.append(text)
 
-    # Lemmatize
-    docs = [' '.join(token.lemma_ if token.lemma_ != '-PRON-'
-                     else str(token) for token in NLP(doc)) for doc in _docs]
-
-    # Remove non-alphanums
-    tokenizer = RegexpTokenizer(r'\w+')
-    for idx in range(len(docs)):
-        docs[idx] = docs[idx].lower()  # Convert to lowercase
-        docs[idx] = tokenizer.tokenize(docs[idx])  # Split into words
-
-    # Remove numbers
-    docs = [[token for token in doc if not token.isnumeric()] for doc in docs]
+    # Lemmatize, split into words and remove numbers, optionally
+    # sharded across processes and skipping texts already in the cache
+    with (shelve.open(cache) if cache is not None else nullcontext({})) as _cache:
+        keys = [_cache_key(text) for text in _docs]
+        missing = {key: text for key, text in zip(keys, _docs) if key not in _cache}
+        texts = list(missing.values())
+        metrics.count('tokenize.cache_hits', len(keys) - len(missing))
+        if n_jobs > 1:
+            lemmatized = map_shards(_lemmatize_and_split, texts, n_jobs,
+                                    initializer=nlp)
+        else:
+            lemmatized = _lemmatize_and_split(texts, batch_size=batch_size)
+        lemmatized = dict(zip(missing, lemmatized))
+        for key, doc in lemmatized.items():
+            _cache[key] = doc
+        docs = [lemmatized[key] if key in lemmatized else _cache[key] for key in keys]
 
-    # # Add bigrams and trigrams to docs
-    # docs = grammer(docs, size=3)
+    # Add bigrams and trigrams (etc) to docs
+    if isinstance(phrasers, int):
+        phrasers = train_phrasers(docs, size=phrasers)
+    if phrasers is not None:
+        docs = list(add_phrases(docs, phrasers))
 
     # Remove short tokens
     docs = [[token for token in doc if len(token) > 1] for doc in docs]
@@ -0,0 +1,17 @@
+'''
+tokens
+======
+
+Split text into words, as the first step of :obj:`tokenizer.tokenize` and
+for the :obj:`inverted_index`. Kept free of dependencies (e.g. NLTK data),
+so that modules which only need to split text can be used without them.
+'''
+
+import re
+
+TOKENIZER = re.compile(r'\w+')  # As nltk.tokenize.RegexpTokenizer(r'\w+')
+
+
+def split_tokens(text):
+    '''Lowercase and split text into words, as in :obj:`tokenizer.tokenize`'''
+    return TOKENIZER.findall(text.lower())